@@ -0,0 +1,58 @@
+"""backfill a long range from a fake client, interrupt it and resume it, and check
+that the peak memory does not grow with the length of the range
+
+usage: python -m benchmarks.backfill
+"""
+import logging
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from requests import HTTPError
+
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from data_extraction.data import DataHandler
+from data_extraction.store import ParquetStore
+
+
+class FlakyClient(FakeEntsoePandasClient):
+    """fails every query after the first fail_after calls, like a lost connection"""
+
+    def __init__(self, fail_after: int, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_after = fail_after
+
+    def _sleep(self, query_name: str) -> None:
+        super()._sleep(query_name)
+        if len(self.calls) > self.fail_after:
+            raise HTTPError("503 Service Unavailable")
+
+
+def backfill(client, store: ParquetStore, months: int) -> tuple[dict, float, float]:
+    data_handler = DataHandler("", e_client=client, store=store)
+    end = pd.Timestamp("2024-01-01", tz="Europe/Brussels")
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    summary = data_handler.backfill("DE", end - pd.DateOffset(months=months), end)
+    duration = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summary, duration, peak / 1024**2
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    for months in (3, 12, 24):
+        store = ParquetStore(tempfile.mkdtemp())
+        summary, duration, peak = backfill(FakeEntsoePandasClient(latency=0.05), store, months)
+        print(f"{months} months: {summary}, {duration:.1f} s, peak {peak:.1f} MiB")
+
+    store = ParquetStore(tempfile.mkdtemp())
+    summary, _, _ = backfill(FlakyClient(fail_after=10, latency=0.05), store, 12)
+    print(f"interrupted run: {summary}")
+    client = FakeEntsoePandasClient(latency=0.05)
+    summary, _, _ = backfill(client, store, 12)
+    print(f"resumed run:     {summary}, requests {len(client.calls)}")
+    df = store.read("df_generation", "DE")
+    print(f"stored generation rows: {len(df)}, duplicated: {df.index.duplicated().sum()}")
@@ -0,0 +1,89 @@
+"""compare the per country chart calculation with the batch path for many countries
+
+the batch results must equal the per country ones, also for a country without
+generation data, the script exits non zero otherwise
+
+usage: python -m benchmarks.batch_charts [n_countries]
+"""
+import copy
+import logging
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from data_extraction.charts import (
+    calculate_chart1_data_batch,
+    calculate_chart2_data_batch,
+    stack_country_data,
+)
+from data_extraction.data import DataHandler
+
+
+def prepare_data_handlers(n_countries: int) -> dict:
+    data_handlers = {}
+    for i in range(n_countries):
+        data_handler = DataHandler("", e_client=FakeEntsoePandasClient(seed=i))
+        data_handler.get_new_data(f"C{i:02d}", forecast=True)
+        data_handlers[f"C{i:02d}"] = data_handler
+    return data_handlers
+
+
+def per_country_loop(data_handlers: dict) -> list:
+    return [
+        (data_handler.calculate_chart1_data(), data_handler.calculate_chart2_data())
+        for data_handler in data_handlers.values()
+    ]
+
+
+def batch(data_handlers: dict) -> tuple:
+    stacked = stack_country_data(data_handlers)
+    return calculate_chart1_data_batch(stacked), calculate_chart2_data_batch(stacked)
+
+
+def check_batch_equals_per_country(data_handlers: dict) -> None:
+    per_country = dict(zip(data_handlers, per_country_loop(copy.deepcopy(data_handlers))))
+    chart1, chart2 = batch(copy.deepcopy(data_handlers))
+    for country_code, (country_chart1, country_chart2) in per_country.items():
+        for batch_chart, country_chart in ((chart1, country_chart1), (chart2, country_chart2)):
+            if country_chart.empty:
+                assert country_code not in batch_chart.index.unique(0), country_code
+                continue
+            pd.testing.assert_frame_equal(
+                batch_chart.xs(country_code).dropna(axis=1, how="all").sort_index(),
+                country_chart.sort_index(),
+                check_names=False,
+                check_freq=False,
+            )
+
+
+def measure(func, data_handlers: dict, repeat: int = 5) -> tuple[float, float]:
+    durations = []
+    for _ in range(repeat):
+        # fresh copy, calculate_chart2_data renames inplace
+        handlers = copy.deepcopy(data_handlers)
+        start = time.perf_counter()
+        func(handlers)
+        durations.append(time.perf_counter() - start)
+    handlers = copy.deepcopy(data_handlers)
+    tracemalloc.start()
+    result = func(handlers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(durations), peak / 1024**2
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    n_countries = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    data_handlers = prepare_data_handlers(n_countries)
+    check_batch_equals_per_country(data_handlers)
+    # a country with forecasts, but without generation data gets no chart1 data
+    data_handlers["C01"].data["df_generation"] = pd.DataFrame()
+    check_batch_equals_per_country(data_handlers)
+    print("batch results equal the per country results")
+    for label, func in (("per country loop", per_country_loop), ("batch", batch)):
+        duration, peak = measure(func, data_handlers)
+        print(f"{label} ({n_countries} countries): {duration * 1000:.1f} ms, peak {peak:.1f} MiB")
@@ -0,0 +1,65 @@
+"""compare the bulk user import with per row inserts on sqlite
+
+usage: python -m benchmarks.bulk_users [n_users]
+"""
+import logging
+import sys
+import tempfile
+import time
+
+import sqlalchemy as db
+
+from user_management.database_handling import (
+    DBBase,
+    User,
+    add_user_to_db,
+    delete_users,
+    export_users,
+    import_users,
+)
+
+
+def sqlite_engine() -> db.Engine:
+    engine = db.create_engine(f"sqlite:///{tempfile.mkdtemp()}/users.sqlite")
+    DBBase.metadata.create_all(engine)
+    return engine
+
+
+def write_user_csv(n_users: int, path: str) -> None:
+    with open(path, "w") as file:
+        file.write("name,email,country_code\n")
+        for i in range(n_users):
+            file.write(f"user{i},user{i}@example.com,{('DE', 'BE', 'FR')[i % 3]}\n")
+
+
+if __name__ == "__main__":
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    directory = tempfile.mkdtemp()
+    csv_path = f"{directory}/users.csv"
+    write_user_csv(n_users, csv_path)
+
+    n_per_row = min(n_users, 1000)
+    engine = sqlite_engine()
+    start = time.perf_counter()
+    for i in range(n_per_row):
+        add_user_to_db(
+            User(name=f"user{i}", email=f"user{i}@example.com", country_code="DE"), engine
+        )
+    per_row = (time.perf_counter() - start) / n_per_row
+    print(f"add_user_to_db: {1 / per_row:.0f} rows/s, ~{per_row * n_users:.0f} s for {n_users}")
+
+    engine = sqlite_engine()
+    for label in ("import (insert)", "import (upsert)"):
+        start = time.perf_counter()
+        import_users(csv_path, engine)
+        duration = time.perf_counter() - start
+        print(f"{label}: {n_users / duration:.0f} rows/s, {duration:.2f} s for {n_users}")
+
+    start = time.perf_counter()
+    export_users(f"{directory}/export.jsonl", engine)
+    print(f"export: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    deleted = delete_users(emails=[f"user{i}@example.com" for i in range(10_000)], engine=engine)
+    print(f"delete {deleted} users by email: {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,144 @@
+"""scheduled runs of the tasks of send_newsletters_flow with and without change
+detection (fake entsoe client, local smtp sink, sqlite delivery ledger)
+
+1. first run: every user gets the report
+2. next scheduled run, entsoe didn't publish anything new: with change detection
+   every country is skipped after the fetch, without it all reports are sent again
+3. next scheduled run, new data and an smtp outage after half of the emails:
+   the countries with failed deliveries keep their old reference
+4. rerun of 3. after the outage: only the pending users get the report
+
+the script exits non zero if a run with change detection sends too much or too little
+
+usage: python -m benchmarks.change_detection [n_users] [n_countries]
+"""
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import sqlalchemy as db
+from prefect.logging import disable_run_logger
+
+from benchmarks.delivery_ledger import OutageHandler
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from benchmarks.smtp_delivery import local_credentials, start_smtp_sink
+from data_extraction import data
+from prefect_flows import send_newsletters
+from prefect_flows.email_delivery import BatchEmailSender
+from prefect_flows.send_newsletters import (
+    User,
+    commit_sent_reports,
+    prepare_country_report_task,
+    send_country_newsletters_task,
+)
+from user_management import database_handling
+
+SMTP_PORT = 8029
+API_KEY = "benchmark"
+RUN_START = datetime.datetime(2024, 6, 1, 8)
+
+
+def run(
+    countries: list,
+    users_per_country: int,
+    change_threshold: float,
+    run_start: datetime.datetime,
+) -> tuple[int, int, int]:
+    """the report and delivery tasks of one sequential flow run,
+    returns (sent, failed, skipped countries)
+    """
+    reports, results = {}, {}
+    with disable_run_logger():
+        for country_code in countries:
+            reports[country_code] = prepare_country_report_task.fn(
+                country_code, API_KEY, "1", change_threshold
+            )
+            users = [
+                User(f"user{i}", f"user{i}@{country_code}.example.com", country_code)
+                for i in range(users_per_country)
+            ]
+            results[country_code] = send_country_newsletters_task.fn(
+                country_code, users, reports[country_code], run_start
+            )
+    if change_threshold >= 0:
+        commit_sent_reports(reports, results)
+    all_results = [result for country_results in results.values() for result in country_results]
+    sent = sum(result.success for result in all_results)
+    skipped = sum(report is None for report in reports.values())
+    return sent, len(all_results) - sent, skipped
+
+
+def set_client(seed: int) -> None:
+    """the entsoe client of the flow, a new seed is newly published data"""
+    data._entsoe_clients[API_KEY] = FakeEntsoePandasClient(seed=seed)
+    data.evict_dataset_cache(clear=True)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_countries = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    countries = [f"C{i:03d}" for i in range(n_countries)]
+    users_per_country = n_users // n_countries
+    n_users = users_per_country * n_countries
+    os.environ["ENTSOE_CACHE_BACKEND"] = "none"
+
+    handler = OutageHandler(float("inf"))
+    controller, _ = start_smtp_sink(SMTP_PORT, handler)
+    send_newsletters._email_sender = BatchEmailSender(local_credentials(SMTP_PORT), rate_limit=0)
+    try:
+        for label, change_threshold in (
+            ("without change detection", -1.0),
+            ("with change detection", 0.0),
+        ):
+            os.environ["FINGERPRINT_DIR"] = tempfile.mkdtemp()
+            engine = db.create_engine(f"sqlite:///{tempfile.mkdtemp()}/ledger.sqlite")
+            database_handling.DBBase.metadata.create_all(engine)
+            database_handling._engine = engine
+            set_client(seed=0)
+            handler.capacity, handler.received = float("inf"), 0
+
+            phases = {}
+            for phase, hours in (
+                ("first run", 0),
+                ("unchanged next run", 1),
+                ("new data, smtp outage", 2),
+                ("rerun after the outage", 2),
+            ):
+                if phase == "new data, smtp outage":
+                    set_client(seed=1)
+                    handler.capacity, handler.received = n_users // 2, 0
+                elif phase == "rerun after the outage":
+                    handler.capacity = float("inf")
+                start = time.perf_counter()
+                phases[phase] = run(
+                    countries,
+                    users_per_country,
+                    change_threshold,
+                    RUN_START + datetime.timedelta(hours=hours),
+                )
+                sent, failed, skipped = phases[phase]
+                print(
+                    f"{label}, {phase}: {time.perf_counter() - start:.2f} s, {sent} sent, "
+                    f"{failed} failed, {skipped} of {n_countries} countries skipped"
+                )
+            engine.dispose()
+
+            assert phases["first run"][:2] == (n_users, 0)
+            outage_sent, outage_failed, _ = phases["new data, smtp outage"]
+            assert outage_failed > 0, "the outage didn't fail any delivery"
+            # the ledger: the rerun only sends to the users, whose delivery failed
+            assert phases["rerun after the outage"][:2] == (outage_failed, 0)
+            if change_threshold >= 0:
+                assert phases["unchanged next run"] == (0, 0, n_countries)
+                # countries with failed deliveries weren't committed and are sent again
+                assert 0 < phases["rerun after the outage"][2] < n_countries
+            else:
+                assert phases["unchanged next run"][:2] == (n_users, 0)
+    finally:
+        send_newsletters._email_sender.close()
+        send_newsletters._email_sender = None
+        controller.stop()
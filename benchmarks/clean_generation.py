@@ -0,0 +1,84 @@
+"""compare the previous and the current DataHandler.clean_api_data on a synthetic
+1 year, 15 min, 20 fuel type generation frame
+
+usage: python -m benchmarks.clean_generation
+"""
+import logging
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from data_extraction.data import DataHandler
+
+
+N_FUEL_TYPES = 20
+N_CONSUMPTION_TYPES = 4
+
+
+def synthetic_data() -> OrderedDict:
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2023-01-01", "2024-01-01", freq="15min", tz="Europe/Brussels", inclusive="left")
+    fuels = [f"Fuel {i:02d}" for i in range(N_FUEL_TYPES)]
+    columns = pd.MultiIndex.from_tuples(
+        [(fuel, "Actual Aggregated") for fuel in fuels]
+        + [(fuel, "Actual Consumption") for fuel in fuels[:N_CONSUMPTION_TYPES]]
+    ).sort_values()
+    forecast_index = pd.date_range(index[-96], periods=192, freq="15min")
+    data = OrderedDict()
+    data["df_generation"] = pd.DataFrame(
+        rng.uniform(0, 5000, (len(index), len(columns))).round(1), index=index, columns=columns
+    )
+    data["df_generation_forecast"] = pd.Series(rng.uniform(0, 50000, len(forecast_index)), index=forecast_index)
+    data["df_installed_capacity"] = pd.DataFrame()
+    data["df_wind_and_solar_forecast"] = pd.DataFrame(
+        rng.uniform(0, 5000, (len(forecast_index), 3)), index=forecast_index, columns=["Solar", "Wind Offshore", "Wind Onshore"]
+    )
+    return data
+
+
+def legacy_clean_api_data(self) -> None:
+    """clean_api_data before the single pass rewrite"""
+    df_cleaned_aggregation = self.data["df_generation"].swaplevel(axis=1)["Actual Aggregated"]
+    df_cleaned_consumption = self.data["df_generation"].swaplevel(axis=1)["Actual Consumption"]
+    common_columns = df_cleaned_aggregation.columns.intersection(df_cleaned_consumption.columns)
+    df_cleaned_consumption.rename(
+        columns={name: name + " (Consumption)" for name in common_columns}, inplace=True
+    )
+    self.df_current_generation = df_cleaned_aggregation.iloc[-4]
+    self.data["df_generation"] = pd.concat(
+        [df_cleaned_aggregation, df_cleaned_consumption * (-1)]
+    ).dropna(axis=1, how="all")
+    self.data["df_generation_forecast"].rename("1 Day Ahead Forecast Total", inplace=True)
+    forecast_begin = self.data["df_generation"].index[-1]
+    for name in ("df_generation_forecast", "df_wind_and_solar_forecast"):
+        self.data[name] = self.data[name].loc[self.data[name].index > forecast_begin]
+
+
+def measure(clean) -> tuple[float, float]:
+    durations = []
+    for _ in range(3):
+        data_handler = DataHandler("", e_client=object())
+        data_handler.data = synthetic_data()
+        start = time.perf_counter()
+        clean(data_handler)
+        durations.append(time.perf_counter() - start)
+    data_handler = DataHandler("", e_client=object())
+    data_handler.data = synthetic_data()
+    tracemalloc.start()
+    clean(data_handler)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(durations), peak / 1024**2
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    for label, clean in (
+        ("previous clean_api_data", legacy_clean_api_data),
+        ("clean_api_data", DataHandler.clean_api_data),
+    ):
+        duration, peak = measure(clean)
+        print(f"{label}: {duration * 1000:.0f} ms, peak {peak:.1f} MiB")
@@ -0,0 +1,73 @@
+"""compare sequential and concurrent entsoe queries of DataHandler.make_api_calls
+
+the concurrent calls must take about as long as the slowest query, and a failed
+query must set the message without touching the results of the others, the
+script exits non zero otherwise
+
+usage: python -m benchmarks.concurrent_fetch
+"""
+import time
+
+from entsoe.exceptions import NoMatchingDataError
+from requests import HTTPError
+
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from data_extraction.data import DataHandler
+
+
+LATENCY = {
+    "query_generation": 0.8,
+    "query_generation_forecast": 0.3,
+    "query_installed_generation_capacity": 0.5,
+    "query_wind_and_solar_forecast": 0.4,
+}
+
+
+class FailingClient(FakeEntsoePandasClient):
+    """raises the given exception for one query, serves the others"""
+
+    def __init__(self, failing_query: str, error: Exception, **kwargs):
+        super().__init__(**kwargs)
+        self.failing_query = failing_query
+        self.error = error
+
+    def _sleep(self, query_name: str) -> None:
+        super()._sleep(query_name)
+        if query_name == self.failing_query:
+            raise self.error
+
+
+def measure(concurrent: bool) -> float:
+    data_handler = DataHandler(
+        "", concurrent=concurrent, e_client=FakeEntsoePandasClient(LATENCY)
+    )
+    start = time.perf_counter()
+    data_handler.make_api_calls("DE", forecast=True)
+    return time.perf_counter() - start
+
+
+def check_failed_query(error: Exception) -> None:
+    data_handler = DataHandler(
+        "",
+        concurrent=True,
+        e_client=FailingClient("query_generation_forecast", error, latency=LATENCY),
+    )
+    data_handler.make_api_calls("DE", forecast=True)
+    assert "error" in data_handler.message.lower(), data_handler.message
+    assert data_handler.data["df_generation_forecast"].empty
+    for name in ("df_generation", "df_installed_capacity", "df_wind_and_solar_forecast"):
+        assert not data_handler.data[name].empty, f"{type(error).__name__}: {name} is empty"
+
+
+if __name__ == "__main__":
+    sequential, concurrent = measure(concurrent=False), measure(concurrent=True)
+    print(f"sum of query latencies:     {sum(LATENCY.values()):.2f} s")
+    print(f"slowest query latency:      {max(LATENCY.values()):.2f} s")
+    print(f"sequential make_api_calls:  {sequential:.2f} s")
+    print(f"concurrent make_api_calls:  {concurrent:.2f} s")
+    assert concurrent < max(LATENCY.values()) * 1.5, "slower than the slowest query"
+    assert concurrent < sum(LATENCY.values()) * 0.75, "not faster than sequential"
+
+    for error in (NoMatchingDataError(), HTTPError("503 Service Unavailable")):
+        check_failed_query(error)
+        print(f"failed query ({type(error).__name__}): message set, other results kept")
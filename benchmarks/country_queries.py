@@ -0,0 +1,110 @@
+"""per country queries on a sqlite user table before and after migrate_schema
+created its indexes (country_code, id) and email
+
+usage: python -m benchmarks.country_queries [n_users] [n_countries]
+"""
+import logging
+import sys
+import tempfile
+import time
+from typing import Callable
+
+import sqlalchemy as db
+
+from prefect_flows.send_newsletters import shard_of
+from user_management.database_handling import (
+    DBBase,
+    User,
+    count_users_by_country,
+    get_country_users,
+    iter_users_by_country,
+    migrate_schema,
+)
+
+SHARD_COUNT = 4
+
+
+def create_unindexed_users(n_users: int, countries: list) -> db.Engine:
+    """user table of the schema before the indexes were added"""
+    engine = db.create_engine(f"sqlite:///{tempfile.mkdtemp()}/users.sqlite")
+    DBBase.metadata.create_all(engine)
+    for index in User.__table__.indexes:
+        index.drop(engine)
+    with engine.begin() as connection:
+        for offset in range(0, n_users, 50_000):
+            connection.execute(
+                db.insert(User),
+                [
+                    {
+                        "name": f"user{i}",
+                        "email": f"user{i}@example.com",
+                        # scattered over the table, like users registering over time
+                        "country_code": countries[(i * 7919) % len(countries)],
+                    }
+                    for i in range(offset, min(offset + 50_000, n_users))
+                ],
+            )
+    return engine
+
+
+def timed(call: Callable) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = call()
+    return time.perf_counter() - start, result
+
+
+def query_plan(engine: db.Engine, sql: str) -> str:
+    with engine.connect() as connection:
+        return "; ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+def run_queries(engine: db.Engine, countries: list, n_users: int) -> dict:
+    shard_countries = [
+        country_code for country_code in countries if shard_of(country_code, SHARD_COUNT) == 0
+    ]
+    emails = [f"user{i}@example.com" for i in range(0, n_users, max(1, n_users // 1000))]
+    timings = {}
+    timings["count per country"], counts = timed(lambda: count_users_by_country(engine))
+    timings["one country"], users = timed(lambda: get_country_users(countries[0], engine))
+    timings[f"shard 0 of {SHARD_COUNT}"], _ = timed(
+        lambda: sum(
+            len(chunk)
+            for _, chunk in iter_users_by_country(engine, country_codes=shard_countries)
+        )
+    )
+
+    def lookup_emails() -> int:
+        with engine.connect() as connection:
+            return len(
+                connection.execute(db.select(User.id).where(User.email.in_(emails))).all()
+            )
+
+    timings["1000 emails"], _ = timed(lookup_emails)
+    assert sum(counts.values()) == n_users and len(users) == counts[countries[0]]
+    return timings
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_countries = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    countries = [f"C{i:02d}" for i in range(n_countries)]
+
+    engine = create_unindexed_users(n_users, countries)
+    before = run_queries(engine, countries, n_users)
+    migration_time, created = timed(lambda: migrate_schema(engine))
+    after = run_queries(engine, countries, n_users)
+
+    print(f"{n_users} users, {n_countries} countries")
+    print(f"migrate_schema: {migration_time:.2f} s, created {created}")
+    print(f"{'query':>20} {'before s':>10} {'after s':>10}")
+    for name in before:
+        print(f"{name:>20} {before[name]:>10.3f} {after[name]:>10.3f}")
+    print(
+        "plan of one country:",
+        query_plan(
+            engine,
+            f"SELECT name, email, country_code FROM registered_users "
+            f"WHERE country_code = '{countries[0]}' ORDER BY id",
+        ),
+    )
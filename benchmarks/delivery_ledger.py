@@ -0,0 +1,104 @@
+"""rerun after an smtp outage with and without the delivery ledger
+
+the smtp sink rejects every message after the first n_before_outage, the
+rerun then sends to all users again (no ledger) or only to the pending ones
+(ledger), the rerun with the ledger scales with the number of unsent messages.
+The next scheduled run of the same day must send to all users again, the
+script exits non zero otherwise
+
+usage: python -m benchmarks.delivery_ledger [n_users] [n_before_outage]
+"""
+import datetime
+import logging
+import sys
+import time
+
+from benchmarks.smtp_delivery import SinkHandler, local_credentials, start_smtp_sink
+from benchmarks.user_streaming import create_sqlite_users
+from prefect.logging import disable_run_logger
+
+from prefect_flows import send_newsletters
+from prefect_flows.email_delivery import BatchEmailSender
+from prefect_flows.send_newsletters import (
+    CountryReport,
+    group_users_by_country,
+    send_country_newsletters_task,
+)
+from user_management import database_handling
+from user_management.database_handling import iter_users_from_database
+
+SMTP_PORT = 8028
+RUN_START = datetime.datetime(2024, 6, 1, 8)
+REPORT_BODY = "<h1>Forecast:</h1>" * 50
+
+
+class OutageHandler(SinkHandler):
+    """accepts the first `capacity` messages, then answers like a server in trouble"""
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.capacity = capacity
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.received >= self.capacity:
+            return "451 Requested action aborted: local error in processing"
+        return await super().handle_DATA(server, session, envelope)
+
+
+def run(engine, ledger: bool, run_start: datetime.datetime = RUN_START) -> tuple[int, int]:
+    """the deliveries of send_newsletters_flow, returns (sent, failed)"""
+    sent = failed = 0
+    for users in iter_users_from_database(engine):
+        for country_code, country_users in group_users_by_country(users).items():
+            report = CountryReport(REPORT_BODY, "1", None, country_code)
+            with disable_run_logger():
+                results = send_country_newsletters_task.fn(
+                    country_code, country_users, report, run_start if ledger else None
+                )
+            sent += sum(result.success for result in results)
+            failed += sum(not result.success for result in results)
+    return sent, failed
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_before_outage = int(sys.argv[2]) if len(sys.argv) > 2 else int(n_users * 0.9)
+
+    for ledger in (False, True):
+        engine = create_sqlite_users(n_users)
+        # the users are streamed while the ledger is written, like with postgres
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+        # the ledger functions and the task use the shared engine and sender
+        database_handling._engine = engine
+        handler = OutageHandler(n_before_outage)
+        controller, _ = start_smtp_sink(SMTP_PORT, handler)
+        sender = BatchEmailSender(local_credentials(SMTP_PORT), rate_limit=0)
+        send_newsletters._email_sender = sender
+        try:
+            start = time.perf_counter()
+            sent, failed = run(engine, ledger)
+            first_run = time.perf_counter() - start
+            # the smtp server is back, rerun the flow
+            handler.capacity = float("inf")
+            handler.received = 0
+            start = time.perf_counter()
+            rerun_sent, rerun_failed = run(engine, ledger)
+            rerun = time.perf_counter() - start
+            # the hourly schedule: the next run of the day sends the report again
+            next_sent, _ = run(engine, ledger, RUN_START + datetime.timedelta(hours=1))
+        finally:
+            send_newsletters._email_sender = None
+            sender.close()
+            controller.stop()
+            engine.dispose()
+        print(
+            f"ledger={ledger}: first run {sent} sent, {failed} failed in {first_run:.2f} s | "
+            f"rerun {rerun_sent} sent in {rerun:.2f} s | "
+            f"{'no duplicates' if sent + rerun_sent == n_users else 'duplicates'} | "
+            f"next scheduled run {next_sent} sent"
+        )
+        assert next_sent == n_users, "the next scheduled run skipped users"
+        if ledger:
+            assert sent + rerun_sent == n_users, "the rerun sent duplicates"
@@ -0,0 +1,131 @@
+import time
+import numpy as np
+import pandas as pd
+
+
+FUEL_TYPES = [
+    "Biomass",
+    "Fossil Brown coal/Lignite",
+    "Fossil Gas",
+    "Fossil Hard coal",
+    "Hydro Pumped Storage",
+    "Hydro Run-of-river and poundage",
+    "Nuclear",
+    "Other",
+    "Solar",
+    "Wind Offshore",
+    "Wind Onshore",
+]
+# fuel types which also report an "Actual Consumption" column
+CONSUMPTION_TYPES = ["Hydro Pumped Storage", "Solar"]
+WIND_AND_SOLAR = ["Solar", "Wind Offshore", "Wind Onshore"]
+
+
+def _hash_noise(timestamps: np.ndarray, n_columns: int, seed: int) -> np.ndarray:
+    """uniform [0, 1) noise per (timestamp, column), a pure function of its
+    arguments (splitmix64), so overlapping windows get identical values
+    """
+    x = (
+        timestamps.astype(np.uint64)[:, None]
+        + np.arange(1, n_columns + 1, dtype=np.uint64) * np.uint64(0xD1B54A32D192ED03)
+        + np.uint64(seed)
+    )
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / 2**53
+
+
+class FakeEntsoePandasClient:
+    """stand-in for entsoe.EntsoePandasClient which serves synthetic data
+
+    every query sleeps for the configured latency (in seconds) to simulate
+    the http round trip, the generated frames have the same shape as the
+    ones returned by the real client. Values depend only on seed, country,
+    column and timestamp (a daily profile with noise), so repeated and
+    overlapping requests return the same numbers.
+
+    the frame size is set by freq (rows) and n_fuel_types (columns, fuel
+    types beyond the real ones are named "Other 12", "Other 13", ...)
+    """
+
+    def __init__(
+        self,
+        latency: float | dict = 0.0,
+        freq: str = "15min",
+        seed: int = 0,
+        n_fuel_types: int = len(FUEL_TYPES),
+    ):
+        self.latency = latency
+        self.freq = freq
+        self.seed = seed
+        self.fuel_types = FUEL_TYPES + [
+            f"Other {i}" for i in range(len(FUEL_TYPES), n_fuel_types)
+        ]
+        self.calls = []
+
+    def _sleep(self, query_name: str) -> None:
+        self.calls.append(query_name)
+        latency = (
+            self.latency.get(query_name, 0.0)
+            if isinstance(self.latency, dict)
+            else self.latency
+        )
+        if latency:
+            time.sleep(latency)
+
+    def _index(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DatetimeIndex:
+        return pd.date_range(start.ceil(self.freq), end, freq=self.freq, inclusive="left")
+
+    def _values(self, country_code: str, index: pd.DatetimeIndex, n_columns: int) -> np.ndarray:
+        country_seed = [self.seed, *country_code.encode()]
+        rng = np.random.default_rng(country_seed)
+        level = rng.uniform(500, 5000, size=n_columns)
+        phase = rng.uniform(0, 2 * np.pi, size=n_columns)
+        seconds = index.asi8 // 10**9
+        daily = np.sin(2 * np.pi * (seconds % 86400)[:, None] / 86400 + phase)
+        noise = _hash_noise(seconds, n_columns, int(rng.integers(2**62)))
+        return (level * (1 + 0.3 * daily) * (0.9 + 0.2 * noise)).round(1)
+
+    def query_generation(self, country_code, start, end, **kwargs) -> pd.DataFrame:
+        self._sleep("query_generation")
+        index = self._index(start, end)
+        columns = pd.MultiIndex.from_tuples(
+            [(fuel, "Actual Aggregated") for fuel in self.fuel_types]
+            + [(fuel, "Actual Consumption") for fuel in CONSUMPTION_TYPES]
+        ).sort_values()
+        return pd.DataFrame(
+            self._values(country_code, index, len(columns)), index=index, columns=columns
+        )
+
+    def query_generation_forecast(self, country_code, start, end, **kwargs) -> pd.Series:
+        self._sleep("query_generation_forecast")
+        index = self._index(start, end)
+        return pd.Series(
+            self._values(country_code, index, 1)[:, 0] * len(self.fuel_types),
+            index=index,
+            name="Actual Aggregated",
+        )
+
+    def query_installed_generation_capacity(
+        self, country_code, start, end, **kwargs
+    ) -> pd.DataFrame:
+        self._sleep("query_installed_generation_capacity")
+        index = pd.DatetimeIndex([pd.Timestamp(year=start.year, month=1, day=1, tz=start.tz)])
+        return pd.DataFrame(
+            self._values(country_code, index, len(self.fuel_types)) * 10,
+            index=index,
+            columns=self.fuel_types,
+        )
+
+    def query_wind_and_solar_forecast(
+        self, country_code, start, end, **kwargs
+    ) -> pd.DataFrame:
+        self._sleep("query_wind_and_solar_forecast")
+        index = self._index(start, end)
+        return pd.DataFrame(
+            self._values(country_code, index, len(WIND_AND_SOLAR)),
+            index=index,
+            columns=WIND_AND_SOLAR,
+        )
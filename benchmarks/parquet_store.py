@@ -0,0 +1,57 @@
+"""check that ParquetStore.read returns the columns of all part files, also
+those which only appear in later writes (e.g. a new fuel type of a country),
+and merges rows written twice per column, the newer values win
+
+exits non zero on a failed check
+
+usage: python -m benchmarks.parquet_store
+"""
+import tempfile
+
+import pandas as pd
+
+from data_extraction.store import ParquetStore
+
+
+def generation(start: str, fuels: list, value: float) -> pd.DataFrame:
+    index = pd.date_range(start, periods=4, freq="15min", tz="Europe/Brussels")
+    return pd.DataFrame(
+        value,
+        index=index,
+        columns=pd.MultiIndex.from_tuples([(fuel, "Actual Aggregated") for fuel in fuels]),
+    )
+
+
+if __name__ == "__main__":
+    store = ParquetStore(tempfile.mkdtemp())
+    store.write("df_generation", "DE", generation("2024-01-01 00:00", ["Solar"], 1.0))
+    store.write(
+        "df_generation", "DE", generation("2024-01-02 00:00", ["Solar", "Nuclear"], 2.0)
+    )
+    # the same day twice, the later part with a column less
+    store.write(
+        "df_generation", "DE", generation("2024-01-02 00:00", ["Nuclear"], 3.0)
+    )
+
+    df = store.read("df_generation", "DE")
+    assert list(df.columns) == [
+        ("Solar", "Actual Aggregated"),
+        ("Nuclear", "Actual Aggregated"),
+    ], df.columns
+    assert len(df) == 8, len(df)
+    assert df[("Solar", "Actual Aggregated")].iloc[:4].eq(1.0).all()
+    assert df[("Nuclear", "Actual Aggregated")].iloc[:4].isna().all()
+    assert df[("Nuclear", "Actual Aggregated")].iloc[4:].eq(3.0).all()
+    # the part without solar doesn't discard the solar values of the day
+    assert df[("Solar", "Actual Aggregated")].iloc[4:].eq(2.0).all()
+
+    nuclear = store.read(
+        "df_generation",
+        "DE",
+        start=pd.Timestamp("2024-01-02", tz="Europe/Brussels"),
+        columns=["Nuclear"],
+    )
+    assert list(nuclear.columns) == [("Nuclear", "Actual Aggregated")], nuclear.columns
+    assert len(nuclear) == 4, len(nuclear)
+    assert store.read("df_generation", "FR").empty
+    print("parquet store: columns of all parts are read")
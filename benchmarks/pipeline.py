@@ -0,0 +1,191 @@
+"""offline benchmark of the newsletter pipeline at different scales
+
+every scale runs in a fresh process against a fake entsoe client, a sqlite user
+table with N users across M countries and a local smtp sink. The stages run one
+after the other for all countries (read_users, fetch, clean, chart, render,
+send) and are reported with throughput, latency percentiles and the peak rss
+of the process at the end of the stage.
+
+usage: python -m benchmarks.pipeline [N_USERSxM_COUNTRIES ...] [--latency s]
+    [--freq 15min] [--fuel-types n]
+e.g.:  python -m benchmarks.pipeline 1000x4 10000x20 --latency 0.05
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from benchmarks.smtp_delivery import local_credentials, start_smtp_sink
+from benchmarks.user_streaming import create_sqlite_users
+
+
+DEFAULT_SCALES = ("100x4", "1000x10", "10000x20")
+SMTP_PORT = 8027
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on linux, bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageTimer:
+    """latencies and processed items per stage"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.items: Dict[str, int] = {}
+        self.wall_times: Dict[str, float] = {}
+        self.peak_rss: Dict[str, float] = {}
+
+    def run(self, stage: str, calls: Iterable[Callable[[], int]]) -> None:
+        """run the calls of a stage, each returns the number of processed items"""
+        latencies = self.latencies.setdefault(stage, [])
+        stage_start = time.perf_counter()
+        for call in calls:
+            start = time.perf_counter()
+            self.items[stage] = self.items.get(stage, 0) + call()
+            latencies.append(time.perf_counter() - start)
+        self.wall_times[stage] = time.perf_counter() - stage_start
+        self.peak_rss[stage] = peak_rss_mb()
+
+    def report(self) -> List[Dict]:
+        rows = []
+        for stage, latencies in self.latencies.items():
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1e3
+            rows.append(
+                {
+                    "stage": stage,
+                    "calls": len(latencies),
+                    "items": self.items[stage],
+                    "items/s": self.items[stage] / self.wall_times[stage],
+                    "p50 ms": p50,
+                    "p95 ms": p95,
+                    "p99 ms": p99,
+                    "peak rss MiB": self.peak_rss[stage],
+                }
+            )
+        return rows
+
+
+def run_scale(
+    n_users: int, n_countries: int, latency: float, freq: str, n_fuel_types: int
+) -> List[Dict]:
+    # imported here, so that the rss of every scale starts from a fresh process
+    from data_extraction.data import DataHandler
+    from prefect_flows.email_delivery import BatchEmailSender
+    from prefect_flows.rendering import render_country_report
+    from prefect_flows.send_newsletters import build_user_email, group_users_by_country
+    from user_management.database_handling import USER_CHUNK_SIZE, iter_users_from_database
+
+    logging.disable(logging.CRITICAL)
+    countries = [f"C{i:03d}" for i in range(n_countries)]
+    engine = create_sqlite_users(n_users, countries)
+    client = FakeEntsoePandasClient(latency, freq=freq, n_fuel_types=n_fuel_types)
+    controller, _ = start_smtp_sink(SMTP_PORT)
+    sender = BatchEmailSender(local_credentials(SMTP_PORT), rate_limit=0)
+    timer = StageTimer()
+
+    batches = iter_users_from_database(engine)
+    users_by_country: Dict = {}
+
+    def read_batch() -> int:
+        users = next(batches, [])
+        for country_code, country_users in group_users_by_country(users).items():
+            users_by_country.setdefault(country_code, []).extend(country_users)
+        return len(users)
+
+    # one extra call, which finds the stream exhausted
+    timer.run("read_users", [read_batch] * (-(-n_users // USER_CHUNK_SIZE) + 1))
+
+    data_handlers = {
+        country_code: DataHandler("", concurrent=True, e_client=client)
+        for country_code in countries
+    }
+
+    def stage_calls(method: Callable[[str], int]) -> List[Callable[[], int]]:
+        return [
+            lambda country_code=country_code: method(country_code)
+            for country_code in countries
+        ]
+
+    # the per country stages process one country per call,
+    # send processes the users of a country
+    def fetch(country_code: str) -> int:
+        data_handlers[country_code].make_api_calls(country_code, forecast=True)
+        return 1
+
+    def clean(country_code: str) -> int:
+        data_handlers[country_code].clean_api_data()
+        return 1
+
+    def chart(country_code: str) -> int:
+        data_handler = data_handlers[country_code]
+        data_handler.data["chart1_data"] = data_handler.calculate_chart1_data()
+        data_handler.data["chart2_data"] = data_handler.calculate_chart2_data()
+        return 1
+
+    reports = {}
+
+    def render(country_code: str) -> int:
+        reports[country_code] = render_country_report(
+            country_code, data_handlers[country_code].data["df_generation_forecast"]
+        )
+        return 1
+
+    def send(country_code: str) -> int:
+        users = users_by_country.get(country_code, [])
+        results = sender.send_batch(
+            build_user_email(user, reports[country_code]) for user in users
+        )
+        return sum(result.success for result in results)
+
+    timer.run("fetch", stage_calls(fetch))
+    timer.run("clean", stage_calls(clean))
+    timer.run("chart", stage_calls(chart))
+    timer.run("render", stage_calls(render))
+    timer.run("send", stage_calls(send))
+
+    sender.close()
+    controller.stop()
+    engine.dispose()
+    return timer.report()
+
+
+def print_report(scale: str, rows: List[Dict]) -> None:
+    print(f"\n{scale}")
+    columns = list(rows[0])
+    print(" ".join(f"{column:>12}" for column in columns))
+    for row in rows:
+        print(
+            " ".join(
+                f"{value:>12.1f}" if isinstance(value, float) else f"{value:>12}"
+                for value in row.values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scales", nargs="*", default=DEFAULT_SCALES)
+    parser.add_argument("--latency", type=float, default=0.0, help="per entsoe query in s")
+    parser.add_argument("--freq", default="15min", help="resolution of the fake data")
+    parser.add_argument("--fuel-types", type=int, default=11, help="generation columns")
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        n_users, n_countries = (int(part) for part in scale.lower().split("x"))
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            rows = executor.submit(
+                run_scale, n_users, n_countries, args.latency, args.freq, args.fuel_types
+            ).result()
+        print_report(f"{n_users} users x {n_countries} countries", rows)
@@ -0,0 +1,119 @@
+"""100 concurrent make_api_calls for the same country, once as threads of one
+process and once spread over several processes sharing a local cache directory,
+every query must reach the (fake) entsoe api exactly once. Then many puts into
+a small cache, which must keep its size limit without listing the backend on
+every put. The script exits non zero if a check fails
+
+usage: python -m benchmarks.request_coalescing
+"""
+import logging
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from benchmarks.fake_entsoe import FakeEntsoePandasClient
+from data_extraction.cache import EVICT_TO_SHARE, LocalDirectoryBackend, ResponseCache
+from data_extraction.data import DataHandler
+
+
+CALLERS = 100
+PROCESSES = 4
+LATENCY = 0.5
+# queries of make_api_calls(forecast=True)
+QUERIES = {
+    "query_generation",
+    "query_generation_forecast",
+    "query_installed_generation_capacity",
+    "query_wind_and_solar_forecast",
+}
+
+
+def assert_called_once(calls: Counter, label: str) -> None:
+    assert calls == Counter(QUERIES), (
+        f"{label}: upstream calls {dict(calls)}, expected one per query"
+    )
+
+
+def call_concurrently(
+    client: FakeEntsoePandasClient, callers: int, cache: ResponseCache | None = None
+) -> None:
+    def call(_):
+        data_handler = DataHandler("", concurrent=True, e_client=client, cache=cache)
+        data_handler.make_api_calls("DE", forecast=True)
+        return data_handler
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        data_handlers = list(executor.map(call, range(callers)))
+    assert all(
+        not data_handler.data["df_generation"].empty for data_handler in data_handlers
+    )
+
+
+class CountingBackend(LocalDirectoryBackend):
+    """counts the listings of the backend, a paginated list request on s3"""
+
+    listings = 0
+
+    def entries(self):
+        self.listings += 1
+        return super().entries()
+
+
+def check_eviction(puts: int = 2000, value_size: int = 1000) -> None:
+    backend = CountingBackend(tempfile.mkdtemp())
+    cache = ResponseCache(backend, max_size_mb=0.5)
+    for i in range(puts):
+        cache.put(("query_generation", "DE", str(i), str(i + 1)), b"x" * value_size)
+    total_size = sum(entry.size for entry in backend.entries())
+    print(
+        f"{puts} puts of {value_size} bytes: {backend.listings - 1} listings, "
+        f"{total_size / 1024**2:.2f} of {cache.max_size_bytes / 1024**2:.2f} MB"
+    )
+    assert total_size <= cache.max_size_bytes, "size limit exceeded"
+    # a listing after the first put and after every EVICT_TO_SHARE of freed space
+    freed_per_eviction = cache.max_size_bytes * (1 - EVICT_TO_SHARE)
+    assert backend.listings - 1 <= 1 + puts * value_size / freed_per_eviction, (
+        "the backend is listed too often"
+    )
+
+
+def process_callers(cache_dir: str, callers: int, start_at: float) -> Counter:
+    logging.disable(logging.CRITICAL)
+    client = FakeEntsoePandasClient(LATENCY)
+    cache = ResponseCache(LocalDirectoryBackend(cache_dir))
+    # all processes start their callers at the same moment
+    time.sleep(max(0.0, start_at - time.time()))
+    call_concurrently(client, callers, cache)
+    return Counter(client.calls)
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+
+    client = FakeEntsoePandasClient(LATENCY)
+    start = time.perf_counter()
+    call_concurrently(client, CALLERS)
+    print(
+        f"{CALLERS} threads:             {time.perf_counter() - start:.2f} s, "
+        f"upstream calls {dict(Counter(client.calls))}"
+    )
+    assert_called_once(Counter(client.calls), f"{CALLERS} threads")
+
+    cache_dir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=PROCESSES) as executor:
+        counters = executor.map(
+            process_callers,
+            [cache_dir] * PROCESSES,
+            [CALLERS // PROCESSES] * PROCESSES,
+            [time.time() + 3] * PROCESSES,
+        )
+        calls = sum(counters, Counter())
+    print(
+        f"{PROCESSES} processes x {CALLERS // PROCESSES} threads: "
+        f"{time.perf_counter() - start - 3:.2f} s, upstream calls {dict(calls)}"
+    )
+    assert_called_once(calls, f"{PROCESSES} processes")
+
+    check_eviction()
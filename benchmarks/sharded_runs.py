@@ -0,0 +1,62 @@
+"""run several shard processes against one sqlite user table, check that every user
+is processed exactly once and compare the throughput for different shard counts
+
+the shards read their users with iter_registered_user_batches like the flow,
+the script exits non zero if a user is missed or processed twice
+
+usage: python -m benchmarks.sharded_runs [n_users]
+"""
+import logging
+import multiprocessing
+import sys
+import time
+from collections import Counter
+
+import sqlalchemy as db
+
+from benchmarks.user_streaming import create_sqlite_users
+from prefect_flows import send_newsletters
+from user_management import database_handling
+
+# simulated work (render + send) per user in seconds
+WORK_PER_USER = 0.001
+
+
+def run_shard(url: str, shard_index: int, shard_count: int, shard_by: str) -> list:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    # the users of the database, not the test user
+    send_newsletters.TEST_USER_ONLY = 0
+    database_handling._engine = db.create_engine(url)
+    processed = []
+    for users in send_newsletters.iter_registered_user_batches(
+        shard_index, shard_count, shard_by
+    ):
+        for user in users:
+            time.sleep(WORK_PER_USER)
+            processed.append(user["email"] if isinstance(user, dict) else user.email)
+    return processed
+
+
+if __name__ == "__main__":
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    countries = ("DE", "BE", "FR", "NL", "AT", "PL", "CZ", "DK", "ES", "IT", "PT", "SE")
+    engine = create_sqlite_users(n_users, countries)
+    url = engine.url.render_as_string()
+
+    for shard_by in ("country", "email"):
+        for shard_count in (1, 2, 4):
+            start = time.perf_counter()
+            with multiprocessing.Pool(shard_count) as pool:
+                shards = pool.starmap(
+                    run_shard,
+                    [(url, index, shard_count, shard_by) for index in range(shard_count)],
+                )
+            duration = time.perf_counter() - start
+            counts = Counter(email for shard in shards for email in shard)
+            exactly_once = len(counts) == n_users and set(counts.values()) == {1}
+            print(
+                f"shard_by={shard_by} shards={shard_count}: {n_users / duration:.0f} users/s, "
+                f"shard sizes {[len(shard) for shard in shards]}, exactly once: {exactly_once}"
+            )
+            assert exactly_once, f"shard_by={shard_by} shards={shard_count}: users missed"
@@ -0,0 +1,72 @@
+"""measure the throughput of BatchEmailSender against a local smtp sink
+
+needs aiosmtpd (pip install aiosmtpd), usage: python -m benchmarks.smtp_delivery [n_recipients]
+"""
+import sys
+import time
+
+from aiosmtpd.controller import Controller
+from prefect_email import EmailServerCredentials
+
+from prefect_flows.email_delivery import BatchEmailSender, EmailMessage
+
+
+class SinkHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def start_smtp_sink(
+    port: int = 8025, handler: SinkHandler | None = None
+) -> tuple[Controller, SinkHandler]:
+    handler = handler or SinkHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller, handler
+
+
+def local_credentials(port: int = 8025) -> EmailServerCredentials:
+    return EmailServerCredentials(
+        username="newsletter@example.com",
+        password="",
+        smtp_server="127.0.0.1",
+        smtp_type="INSECURE",
+        smtp_port=port,
+    )
+
+
+if __name__ == "__main__":
+    n_recipients = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    controller, handler = start_smtp_sink()
+    messages = [
+        EmailMessage(f"user{i}@example.com", "Benchmark", "<h1>Forecast:</h1>" * 50)
+        for i in range(n_recipients)
+    ]
+    try:
+        # baseline: one new smtp connection per message, as email_send_message does
+        sender = BatchEmailSender(local_credentials(), rate_limit=0)
+        start = time.perf_counter()
+        for message in messages:
+            with local_credentials().get_server() as server:
+                server.send_message(sender._build_mime_message(message))
+        duration = time.perf_counter() - start
+        print(f"connection per message: {n_recipients / duration:.0f} messages/s")
+
+        for pool_size in (1, 4, 8):
+            handler.received = 0
+            with BatchEmailSender(
+                local_credentials(), pool_size=pool_size, rate_limit=0
+            ) as sender:
+                start = time.perf_counter()
+                results = sender.send_batch(messages)
+                duration = time.perf_counter() - start
+            print(
+                f"pool_size={pool_size}: {sum(r.success for r in results)}/{n_recipients} "
+                f"sent, {n_recipients / duration:.0f} messages/s"
+            )
+    finally:
+        controller.stop()
@@ -0,0 +1,95 @@
+"""cold start of the flow container: import time of prefect_flows (like
+python -X importtime -m prefect_flows, without running the flow) and the time
+from process start until the first task of send_newsletters_flow runs
+
+exits with 1 if a dependency, which should only be loaded by the tasks that
+need it, is imported at startup
+
+usage: python -m benchmarks.startup
+"""
+import subprocess
+import sys
+import time
+
+
+# loaded lazily by the tasks of send_newsletters_flow
+LAZY_MODULES = ("pandas", "sqlalchemy", "entsoe", "prefect_email", "pyarrow", "dotenv")
+
+IMPORT_SCRIPT = f"""
+import sys
+import prefect_flows.send_newsletters
+print(",".join(m for m in {LAZY_MODULES!r} if m in sys.modules))
+"""
+
+
+def import_times(top: int = 10) -> tuple[float, list[tuple[int, str]], list[str]]:
+    """import time of send_newsletters in s, its slowest direct imports (cumulative µs)
+    and the lazy modules which were loaded anyway
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == "prefect_flows.send_newsletters":
+            total = int(cumulative) / 1e6
+        # direct imports of send_newsletters
+        elif name.startswith("   ") and not name.startswith("     "):
+            imports.append((int(cumulative), name.strip()))
+    loaded = [name for name in process.stdout.strip().split(",") if name]
+    return total, sorted(imports, reverse=True)[:top], loaded
+
+
+def run_until_first_task(process_start: float) -> None:
+    """run send_newsletters_flow with a users task, which reports its start time,
+    so the flow needs neither blocks nor a database
+    """
+    from types import SimpleNamespace
+
+    from prefect import task
+
+    import prefect_flows.send_newsletters as send_newsletters
+
+    @task
+    def get_registered_users_task():
+        print(f"first task after {time.time() - process_start:.2f} s", flush=True)
+        return []
+
+    class Secret:
+        @classmethod
+        def load(cls, name: str):
+            return SimpleNamespace(get=lambda: "")
+
+    send_newsletters.get_registered_users_task = get_registered_users_task
+    send_newsletters.Secret = Secret
+    send_newsletters.send_newsletters_flow.with_options(retries=0)()
+
+
+def time_to_first_task() -> str:
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--first-task", str(time.time())],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return next(line for line in process.stdout.splitlines() if "first task" in line)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--first-task"]:
+        run_until_first_task(float(sys.argv[2]))
+        sys.exit()
+    total, slowest, loaded = import_times()
+    print(f"import prefect_flows.send_newsletters: {total:.2f} s")
+    for cumulative, name in slowest:
+        print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+    print(time_to_first_task())
+    if loaded:
+        print(f"loaded at startup, but should be lazy: {loaded}")
+        sys.exit(1)
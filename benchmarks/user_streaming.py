@@ -0,0 +1,62 @@
+"""compare the peak memory of loading all users at once and streaming them in chunks
+
+usage: python -m benchmarks.user_streaming [n_users]
+"""
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import sqlalchemy as db
+
+from user_management.database_handling import (
+    DBBase,
+    User,
+    get_all_users_from_database,
+    iter_users_from_database,
+)
+
+
+def create_sqlite_users(n_users: int, countries=("DE", "BE", "FR", "NL")) -> db.Engine:
+    engine = db.create_engine(f"sqlite:///{tempfile.mkdtemp()}/users.sqlite")
+    DBBase.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for offset in range(0, n_users, 10_000):
+            connection.execute(
+                db.insert(User),
+                [
+                    {
+                        "name": f"user{i}",
+                        "email": f"user{i}@example.com",
+                        "country_code": countries[i % len(countries)],
+                    }
+                    for i in range(offset, min(offset + 10_000, n_users))
+                ],
+            )
+    return engine
+
+
+def measure(load) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    load()
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak / 1024**2
+
+
+def consume_stream(engine) -> None:
+    for users in iter_users_from_database(engine):
+        pass
+
+
+if __name__ == "__main__":
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    for n_users in [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 500_000]:
+        engine = create_sqlite_users(n_users)
+        duration, peak = measure(lambda: get_all_users_from_database(engine))
+        print(f"{n_users} users, load all:  {duration:.2f} s, peak {peak:.1f} MiB")
+        duration, peak = measure(lambda: consume_stream(engine))
+        print(f"{n_users} users, streamed:  {duration:.2f} s, peak {peak:.1f} MiB")
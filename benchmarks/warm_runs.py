@@ -0,0 +1,142 @@
+"""latency of consecutive flow runs of a deployment: served by the Runner of
+Flow.serve (a new process per run) and by the WarmRunner of warm_worker (all
+runs in the serving process)
+
+the served flow reads the users from sqlite, fetches (fake entsoe client with
+latency), cleans and renders every country and sends the emails to a local smtp
+sink. A run is timed from its pending state, which the runner sets before it
+starts the run, to its final state, so the runs of the Runner include the
+new process, the imports, the new engine, client and smtp connections and the
+full fetch of all datasets, the warm runs only the incremental work.
+
+needs a prefect api: a running server (PREFECT_API_URL) or the ephemeral one,
+e.g. PREFECT_HOME=$(mktemp -d) python -m benchmarks.warm_runs
+
+usage: python -m benchmarks.warm_runs [n_runs] [--latency s] [--users n] [--countries n]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from prefect import flow
+from prefect.client.orchestration import get_client
+from prefect.client.schemas.objects import StateType
+from prefect.runner import Runner
+
+SMTP_PORT = 8030
+
+_client = None
+
+
+@flow(name="warm-runs-benchmark")
+def pipeline_flow(engine_url: str, latency: float) -> int:
+    """one run of the pipeline, returns the number of sent emails"""
+    global _client
+    from benchmarks.fake_entsoe import FakeEntsoePandasClient
+    from benchmarks.smtp_delivery import local_credentials
+    from data_extraction import data
+    from prefect_flows import send_newsletters
+    from prefect_flows.email_delivery import BatchEmailSender
+    from prefect_flows.rendering import render_country_report
+    from user_management import database_handling
+
+    # process wide state, created by the first run of a process
+    if database_handling._engine is None:
+        import sqlalchemy as db
+
+        database_handling._engine = db.create_engine(engine_url)
+    if send_newsletters._email_sender is None:
+        send_newsletters._email_sender = BatchEmailSender(
+            local_credentials(SMTP_PORT), rate_limit=0
+        )
+    if _client is None:
+        _client = FakeEntsoePandasClient(latency)
+
+    sent = 0
+    for users in send_newsletters.iter_registered_user_batches():
+        for country_code, country_users in send_newsletters.group_users_by_country(users).items():
+            data_handler = data.DataHandler(
+                "", concurrent=True, e_client=_client, incremental=True
+            )
+            data_handler.get_new_data(country_code, forecast=True)
+            body = render_country_report(
+                country_code, data_handler.data["df_generation_forecast"]
+            )
+            results = send_newsletters.get_email_sender().send_batch(
+                send_newsletters.build_user_email(user, body) for user in country_users
+            )
+            sent += sum(result.success for result in results)
+    return sent
+
+
+async def wait_for_run(client, flow_run_id, timeout: float = 600) -> float:
+    """seconds from the pending to the final state of a flow run"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        flow_run = await client.read_flow_run(flow_run_id)
+        if flow_run.state.is_final():
+            if flow_run.state.type != StateType.COMPLETED:
+                raise RuntimeError(f"flow run {flow_run_id} is {flow_run.state.name}")
+            states = await client.read_flow_run_states(flow_run_id)
+            pending = next(state for state in states if state.type == StateType.PENDING)
+            return (flow_run.state.timestamp - pending.timestamp).total_seconds()
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"flow run {flow_run_id} didn't finish in {timeout} s")
+
+
+async def serve_runs(runner: Runner, n_runs: int, parameters: dict) -> list:
+    """serve pipeline_flow with the runner and run it n_runs times"""
+    deployment_id = await runner.add_flow(pipeline_flow, name=type(runner).__name__.lower())
+    serving = asyncio.create_task(runner.start())
+    try:
+        durations = []
+        async with get_client() as client:
+            for _ in range(n_runs):
+                flow_run = await client.create_flow_run_from_deployment(
+                    deployment_id, parameters=parameters
+                )
+                durations.append(await wait_for_run(client, flow_run.id))
+        return durations
+    finally:
+        await runner.stop()
+        await asyncio.gather(serving, return_exceptions=True)
+
+
+async def compare(n_runs: int, parameters: dict) -> tuple[list, list]:
+    from prefect_flows.warm_worker import WarmRunner
+
+    # created in the event loop, like in Flow.serve, polling every second
+    cold = await serve_runs(Runner(query_seconds=1), n_runs, parameters)
+    warm = await serve_runs(WarmRunner(query_seconds=1), n_runs, parameters)
+    return cold, warm
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("n_runs", type=int, nargs="?", default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="per entsoe query in s")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--countries", type=int, default=10)
+    args = parser.parse_args()
+
+    # the flow reads the users of the database, not the test user,
+    # also in the processes of the Runner
+    os.environ["NEWSLETTER_TEST_USER_ONLY"] = "0"
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    from benchmarks.smtp_delivery import start_smtp_sink
+    from benchmarks.user_streaming import create_sqlite_users
+
+    countries = [f"C{i:02d}" for i in range(args.countries)]
+    engine_url = create_sqlite_users(args.users, countries).url.render_as_string()
+    parameters = {"engine_url": engine_url, "latency": args.latency}
+    controller, handler = start_smtp_sink(SMTP_PORT)
+    try:
+        cold, warm = asyncio.run(compare(args.n_runs, parameters))
+    finally:
+        controller.stop()
+    print(f"{args.users} users, {args.countries} countries, {args.latency} s per entsoe query")
+    for run, (cold_seconds, warm_seconds) in enumerate(zip(cold, warm), start=1):
+        print(f"run {run}: Runner {cold_seconds:6.2f} s | WarmRunner {warm_seconds:6.2f} s")
+    assert handler.received == 2 * args.n_runs * args.users, "emails missing"
@@ -0,0 +1,205 @@
+"""compare EntsoePandasClient (BeautifulSoup) and StreamingEntsoeClient (iterparse)
+on the same recorded xml responses: parse time, peak memory and equal results
+
+the fixtures are synthetic documents in the entsoe schema, or real responses
+recorded with --record (needs ENTSOE_API_KEY), both clients get them through a
+fake requests session
+
+usage: python -m benchmarks.xml_parsing [--days 7 30 90] [--record DIR] [--fixtures DIR]
+"""
+import argparse
+import os
+import pathlib
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import requests
+from entsoe import EntsoePandasClient, EntsoeRawClient
+from entsoe.mappings import lookup_area
+
+from data_extraction.xml_client import QUERY_PARAMS, StreamingEntsoeClient
+
+
+NAMESPACE = "urn:iec62325.351:tc57wg16:451-6:generationloaddocument:3:0"
+GENERATION_PSR_TYPES = [f"B{i:02d}" for i in range(1, 21)]
+# psr types which also report consumption, e.g. pumped storage
+CONSUMPTION_PSR_TYPES = ["B10", "B16"]
+WIND_AND_SOLAR_PSR_TYPES = ["B16", "B18", "B19"]
+COUNTRY_CODE = "DE"
+
+
+def _utc(timestamp: pd.Timestamp) -> str:
+    return timestamp.tz_convert("UTC").strftime("%Y-%m-%dT%H:%MZ")
+
+
+def _timeseries(
+    rng: np.random.Generator,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    resolution: str,
+    freq: str,
+    psr_type: str | None = None,
+    consumption: bool = False,
+) -> str:
+    n_points = len(pd.date_range(start, end, freq=freq, inclusive="left"))
+    domain = "outBiddingZone_Domain.mRID" if consumption else "inBiddingZone_Domain.mRID"
+    psr = f"<MktPSRType><psrType>{psr_type}</psrType></MktPSRType>" if psr_type else ""
+    points = "".join(
+        f"<Point><position>{position}</position><quantity>{quantity}</quantity></Point>"
+        for position, quantity in enumerate(rng.integers(0, 20_000, n_points), start=1)
+    )
+    return (
+        f"<TimeSeries><mRID>1</mRID><businessType>A01</businessType>"
+        f"<objectAggregation>A08</objectAggregation>"
+        f'<{domain} codingScheme="A01">10Y1001A1001A83F</{domain}>'
+        f"<quantity_Measure_Unit.name>MAW</quantity_Measure_Unit.name>"
+        f"<curveType>A01</curveType>{psr}"
+        f"<Period><timeInterval><start>{_utc(start)}</start><end>{_utc(end)}</end>"
+        f"</timeInterval><resolution>{resolution}</resolution>{points}</Period>"
+        f"</TimeSeries>"
+    )
+
+
+def fake_document(
+    document_type: str, start: pd.Timestamp, end: pd.Timestamp, seed: int = 0
+) -> bytes:
+    """entsoe xml document with one TimeSeries per psr type (and direction) and day"""
+    rng = np.random.default_rng(seed)
+    series = []
+    if document_type == "A68":
+        year_start = pd.Timestamp(year=start.year, month=1, day=1, tz=start.tz)
+        year_end = year_start + pd.DateOffset(years=1)
+        series = [
+            _timeseries(rng, year_start, year_end, "P1Y", "12M", psr_type)
+            for psr_type in GENERATION_PSR_TYPES
+        ]
+    else:
+        days = pd.date_range(start, end, freq="1D")
+        for day_start, day_end in zip(days[:-1], days[1:]):
+            if document_type == "A71":
+                series.append(_timeseries(rng, day_start, day_end, "PT60M", "60min"))
+                continue
+            psr_types = (
+                WIND_AND_SOLAR_PSR_TYPES if document_type == "A69" else GENERATION_PSR_TYPES
+            )
+            for psr_type in psr_types:
+                series.append(
+                    _timeseries(rng, day_start, day_end, "PT15M", "15min", psr_type)
+                )
+                if document_type == "A75" and psr_type in CONSUMPTION_PSR_TYPES:
+                    series.append(
+                        _timeseries(
+                            rng, day_start, day_end, "PT15M", "15min", psr_type, consumption=True
+                        )
+                    )
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>'
+        f'<GL_MarketDocument xmlns="{NAMESPACE}"><mRID>fixture</mRID>'
+        f"<type>{document_type}</type>"
+        f"<time_Period.timeInterval><start>{_utc(start)}</start><end>{_utc(end)}</end>"
+        f"</time_Period.timeInterval>{''.join(series)}</GL_MarketDocument>"
+    ).encode()
+
+
+class FixtureSession:
+    """requests session which answers every request with the recorded document
+    of its documentType
+    """
+
+    def __init__(self, documents: dict):
+        self.documents = documents
+
+    def get(self, url, params=None, **kwargs) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["content-type"] = "text/xml"
+        response._content = self.documents[params["documentType"]]
+        return response
+
+
+def record_fixtures(directory: str, start: pd.Timestamp, end: pd.Timestamp) -> None:
+    """store real responses of the entsoe api as fixtures"""
+    client = EntsoeRawClient(os.environ["ENTSOE_API_KEY"])
+    area = lookup_area(COUNTRY_CODE)
+    pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+    for params in QUERY_PARAMS.values():
+        response = client._base_request(
+            params={**params, "in_Domain": area.code}, start=start, end=end
+        )
+        (pathlib.Path(directory) / f"{params['documentType']}.xml").write_bytes(response.content)
+
+
+def load_fixtures(directory: str) -> dict:
+    return {
+        path.stem: path.read_bytes() for path in pathlib.Path(directory).glob("*.xml")
+    }
+
+
+def measure(client, start: pd.Timestamp, end: pd.Timestamp) -> tuple[dict, float, float]:
+    def run_queries() -> dict:
+        return {
+            query_name: getattr(client, query_name)(COUNTRY_CODE, start=start, end=end)
+            for query_name in QUERY_PARAMS
+        }
+
+    start_time = time.perf_counter()
+    results = run_queries()
+    duration = time.perf_counter() - start_time
+    # second run for the memory, tracemalloc slows down the parsing
+    tracemalloc.start()
+    run_queries()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return results, duration, peak / 1024**2
+
+
+def compare(documents: dict, start: pd.Timestamp, end: pd.Timestamp) -> None:
+    session = FixtureSession(documents)
+    pandas_results, pandas_time, pandas_peak = measure(
+        EntsoePandasClient("", session=session), start, end
+    )
+    streaming_results, streaming_time, streaming_peak = measure(
+        StreamingEntsoeClient("", session=session), start, end
+    )
+    for query_name, expected in pandas_results.items():
+        assert_equal = (
+            pd.testing.assert_series_equal
+            if isinstance(expected, pd.Series)
+            else pd.testing.assert_frame_equal
+        )
+        assert_equal(streaming_results[query_name], expected, check_freq=False)
+    size = sum(len(document) for document in documents.values()) / 1024**2
+    print(
+        f"{size:7.1f} MiB xml | EntsoePandasClient {pandas_time:6.2f} s, "
+        f"peak {pandas_peak:7.1f} MiB | StreamingEntsoeClient {streaming_time:6.2f} s, "
+        f"peak {streaming_peak:6.1f} MiB | equal results"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--days", type=int, nargs="*", default=[7, 30, 90])
+    parser.add_argument("--record", help="record real responses into this directory")
+    parser.add_argument("--fixtures", help="use the recorded responses of this directory")
+    args = parser.parse_args()
+
+    end = pd.Timestamp("2024-06-01", tz="Europe/Brussels")
+    if args.record:
+        record_fixtures(args.record, end - pd.Timedelta(days=args.days[0]), end)
+    if args.fixtures or args.record:
+        start = end - pd.Timedelta(days=args.days[0])
+        compare(load_fixtures(args.fixtures or args.record), start, end)
+    else:
+        for days in args.days:
+            start = end - pd.Timedelta(days=days)
+            print(f"{days} days:", end=" ")
+            compare(
+                {
+                    document_type: fake_document(document_type, start, end)
+                    for document_type in ("A75", "A71", "A68", "A69")
+                },
+                start,
+                end,
+            )
@@ -0,0 +1,368 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import pandas as pd
+
+from data_extraction.metrics import increment
+
+
+# time to live of a cached response per entsoe query
+DEFAULT_TTLS = {
+    "query_generation": pd.Timedelta(minutes=15),
+    "query_generation_forecast": pd.Timedelta(hours=1),
+    "query_installed_generation_capacity": pd.Timedelta(days=365),
+    "query_wind_and_solar_forecast": pd.Timedelta(hours=1),
+}
+# the window start/end of the cache key are floored to this resolution, so that
+# calls within the same window (e.g. flow retries) share one cache entry,
+# "year" floors to the first of january (installed capacity is published yearly)
+DEFAULT_KEY_RESOLUTIONS = {
+    "query_installed_generation_capacity": "year",
+}
+DEFAULT_KEY_RESOLUTION = "15min"
+DEFAULT_MAX_SIZE_MB = int(os.getenv("ENTSOE_CACHE_MAX_MB", 512))
+# eviction frees space down to this share of the size limit, so a full cache
+# isn't listed again on the next put
+EVICT_TO_SHARE = 0.9
+# in memory cache of the fetched datasets, see DatasetCache
+DATASET_CACHE_MAX_MB = float(os.getenv("DATASET_CACHE_MAX_MB", 256))
+DATASET_CACHE_MAX_AGE = float(os.getenv("DATASET_CACHE_MAX_AGE_SECONDS", 2 * 24 * 3600))
+
+
+class CacheEntry(NamedTuple):
+    name: str
+    size: int
+    last_access: float
+
+
+class LocalDirectoryBackend:
+    """stores cache entries as pickle files in a local directory"""
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def get(self, name: str) -> bytes | None:
+        file = self.path / name
+        try:
+            payload = file.read_bytes()
+        except FileNotFoundError:
+            return None
+        # mtime is used as last access time for the lru eviction
+        try:
+            os.utime(file)
+        except FileNotFoundError:
+            pass
+        return payload
+
+    def put(self, name: str, payload: bytes) -> None:
+        # write to a temporary file first, so concurrent readers never see
+        # a partially written entry
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, prefix=".tmp_")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(payload)
+        os.replace(tmp_name, self.path / name)
+
+    def delete(self, name: str) -> None:
+        (self.path / name).unlink(missing_ok=True)
+
+    def entries(self) -> List[CacheEntry]:
+        entries = []
+        for file in self.path.glob("*.pkl"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append(CacheEntry(file.name, stat.st_size, stat.st_mtime))
+        return entries
+
+
+class S3Backend:
+    """stores cache entries as objects in a s3 compatible bucket
+
+    on s3 the last write time of an object is used as approximation
+    of its last access time for the lru eviction. Needs boto3, which is an
+    optional dependency and not part of requirements.txt
+    """
+
+    def __init__(self, bucket: str, prefix: str = "entsoe-cache", client=None, **client_kwargs):
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", **client_kwargs)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}"
+
+    def get(self, name: str) -> bytes | None:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def put(self, name: str, payload: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=payload)
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def entries(self) -> List[CacheEntry]:
+        entries = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + "/"):
+            for obj in page.get("Contents", []):
+                entries.append(
+                    CacheEntry(
+                        obj["Key"].rsplit("/", 1)[-1],
+                        obj["Size"],
+                        obj["LastModified"].timestamp(),
+                    )
+                )
+        return entries
+
+
+class ResponseCache:
+    """time windowed cache for entsoe responses
+
+    entries are keyed by (query, country, window start, window end), expire after
+    the ttl of their query and the least recently used entries are evicted as soon
+    as the total size exceeds max_size_mb
+
+    listing the entries is expensive on s3, so the total size is only listed by
+    the first put and then estimated from the written entries until the estimate
+    exceeds max_size_mb, the eviction then frees space down to EVICT_TO_SHARE of
+    the limit. Entries written by other processes are only counted by the next
+    listing
+    """
+
+    def __init__(
+        self,
+        backend: LocalDirectoryBackend | S3Backend,
+        ttls: Dict[str, pd.Timedelta] | None = None,
+        max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+    ):
+        self.backend = backend
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_size_bytes = int(max_size_mb * 1024**2)
+        # total size of the entries, None until the first listing
+        self._size_estimate: int | None = None
+        self._size_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        query_name: str, country_code: str, start: pd.Timestamp, end: pd.Timestamp
+    ) -> Tuple[str, str, str, str]:
+        resolution = DEFAULT_KEY_RESOLUTIONS.get(query_name, DEFAULT_KEY_RESOLUTION)
+
+        def floor(timestamp: pd.Timestamp) -> str:
+            if resolution == "year":
+                return timestamp.replace(
+                    month=1, day=1, hour=0, minute=0, second=0, microsecond=0, nanosecond=0
+                ).isoformat()
+            return timestamp.floor(resolution).isoformat()
+
+        return query_name, country_code, floor(start), floor(end)
+
+    @staticmethod
+    def _entry_name(key: Tuple[str, ...]) -> str:
+        return hashlib.sha1("|".join(key).encode()).hexdigest() + ".pkl"
+
+    def get(self, key: Tuple[str, ...]) -> Any | None:
+        name = self._entry_name(key)
+        payload = self.backend.get(name)
+        if payload is None:
+            return None
+        try:
+            entry = pickle.loads(payload)
+        except Exception:
+            logging.warning(f"corrupt cache entry {name} is removed")
+            self.backend.delete(name)
+            return None
+        ttl = self.ttls.get(key[0], pd.Timedelta(0))
+        if time.time() - entry["created"] > ttl.total_seconds():
+            self.backend.delete(name)
+            return None
+        return entry["value"]
+
+    def put(self, key: Tuple[str, ...], value: Any) -> None:
+        payload = pickle.dumps(
+            {"key": key, "created": time.time(), "value": value},
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        self.backend.put(self._entry_name(key), payload)
+        with self._size_lock:
+            if self._size_estimate is not None:
+                # overwritten entries are counted twice until the next listing
+                self._size_estimate += len(payload)
+            if self._size_estimate is None or self._size_estimate > self.max_size_bytes:
+                self._size_estimate = self.evict()
+
+    def evict(self) -> int:
+        """remove the least recently used entries if the size limit is exceeded,
+        returns the total size of the remaining entries
+        """
+        entries = sorted(self.backend.entries(), key=lambda entry: entry.last_access)
+        total_size = sum(entry.size for entry in entries)
+        if total_size <= self.max_size_bytes:
+            return total_size
+        for entry in entries:
+            if total_size <= self.max_size_bytes * EVICT_TO_SHARE:
+                break
+            self.backend.delete(entry.name)
+            total_size -= entry.size
+        return total_size
+
+    def get_or_fetch(
+        self,
+        query_name: str,
+        country_code: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        fetch: Callable[[], Any],
+    ) -> Any:
+        key = self.make_key(query_name, country_code, start, end)
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.put(key, value)
+        else:
+            logging.info(f"cache hit for {key}")
+            increment("cache_hits", country=country_code, query=query_name)
+        return value
+
+
+class DatasetCache:
+    """thread safe in memory lru cache of the fetched frames per (country, dataset),
+    e.g. for the incremental fetches of a long running worker
+
+    entries expire max_age seconds after they were stored and the least recently
+    used ones are evicted as soon as the frames take more than max_size_mb
+    """
+
+    def __init__(
+        self, max_size_mb: float = DATASET_CACHE_MAX_MB, max_age: float = DATASET_CACHE_MAX_AGE
+    ):
+        self.max_size_bytes = int(max_size_mb * 1024**2)
+        self.max_age = max_age
+        self._entries: OrderedDict[Tuple[str, str], Tuple[float, int, Any]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_size(value: pd.DataFrame | pd.Series) -> int:
+        size = value.memory_usage(index=True)
+        return int(size.sum() if isinstance(size, pd.Series) else size)
+
+    def get(self, country_code: str, name: str) -> Any | None:
+        key = (country_code, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.max_age:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, country_code: str, name: str, value: pd.DataFrame | pd.Series) -> None:
+        key = (country_code, name)
+        size = self._frame_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.time(), size, value)
+            self._size += size
+            self._evict_to_size()
+
+    def _pop(self, key: Tuple[str, str]) -> None:
+        self._size -= self._entries.pop(key)[1]
+
+    def _evict_to_size(self) -> None:
+        while self._size > self.max_size_bytes and self._entries:
+            self._pop(next(iter(self._entries)))
+
+    def evict(self) -> int:
+        """remove the expired entries, returns the number of removed entries"""
+        now = time.time()
+        with self._lock:
+            expired = [
+                key for key, entry in self._entries.items() if now - entry[0] > self.max_age
+            ]
+            for key in expired:
+                self._pop(key)
+            self._evict_to_size()
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size_mb(self) -> float:
+        return self._size / 1024**2
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_caches: Dict[tuple, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def cache_from_env() -> ResponseCache | None:
+    """the response cache as configured by the env variables, one per process and
+    configuration, so the size estimate of the cache is kept across the fetches
+
+    ENTSOE_CACHE_BACKEND: "local" (default), "s3" or "none"
+    ENTSOE_CACHE_DIR: directory of the local backend
+    ENTSOE_CACHE_S3_BUCKET / ENTSOE_CACHE_S3_PREFIX / ENTSOE_CACHE_S3_ENDPOINT:
+        location of the s3 backend, which needs boto3 (pip install boto3, not
+        part of requirements.txt)
+    """
+    backend_type = os.getenv("ENTSOE_CACHE_BACKEND", "local").lower()
+    if backend_type == "none":
+        return None
+    if backend_type == "s3":
+        config = (
+            backend_type,
+            os.environ["ENTSOE_CACHE_S3_BUCKET"],
+            os.getenv("ENTSOE_CACHE_S3_PREFIX", "entsoe-cache"),
+            os.getenv("ENTSOE_CACHE_S3_ENDPOINT"),
+        )
+    else:
+        config = (
+            "local",
+            str(
+                os.getenv(
+                    "ENTSOE_CACHE_DIR",
+                    pathlib.Path(tempfile.gettempdir()) / "entsoe_cache",
+                )
+            ),
+        )
+    with _caches_lock:
+        if config not in _caches:
+            if backend_type == "s3":
+                _, bucket, prefix, endpoint_url = config
+                backend = S3Backend(
+                    bucket,
+                    prefix=prefix,
+                    **({"endpoint_url": endpoint_url} if endpoint_url else {}),
+                )
+            else:
+                backend = LocalDirectoryBackend(config[1])
+            _caches[config] = ResponseCache(backend)
+        return _caches[config]
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Dict, TYPE_CHECKING
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from data_extraction.data import DataHandler
+
+
+COUNTRY_LEVEL = "Country"
+
+
+def stack_country_data(data_handlers: Dict[str, "DataHandler"]) -> OrderedDict[str, pd.DataFrame]:
+    """stack the cleaned datasets of several countries into one frame per dataset,
+    with the country as first level of the (multi)index
+    """
+    stacked = OrderedDict()
+    for name in (
+        "df_generation",
+        "df_generation_forecast",
+        "df_installed_capacity",
+        "df_wind_and_solar_forecast",
+    ):
+        frames = {
+            country_code: data_handler.data[name]
+            for country_code, data_handler in data_handlers.items()
+            if not data_handler.data[name].empty
+        }
+        stacked[name] = (
+            pd.concat(frames, names=[COUNTRY_LEVEL, "Date"]) if frames else pd.DataFrame()
+        )
+    current_generation = {
+        country_code: data_handler.df_current_generation
+        for country_code, data_handler in data_handlers.items()
+        if not data_handler.df_current_generation.empty
+    }
+    stacked["df_current_generation"] = (
+        pd.DataFrame.from_dict(current_generation, orient="index").rename_axis(COUNTRY_LEVEL)
+        if current_generation
+        else pd.DataFrame()
+    )
+    return stacked
+
+
+def calculate_chart1_data_batch(data: OrderedDict[str, pd.DataFrame]) -> pd.DataFrame:
+    """chart1 data (generation and forecast per fuel) of all stacked countries at once,
+    countries without generation, forecast or wind and solar forecast are left out,
+    like DataHandler.calculate_chart1_data does per country
+    """
+    generation = data["df_generation"]
+    forecast = data["df_generation_forecast"]
+    wind_and_solar = data["df_wind_and_solar_forecast"]
+    if any(df.empty for df in (generation, forecast, wind_and_solar)):
+        return pd.DataFrame()
+    countries = (
+        generation.index.unique(COUNTRY_LEVEL)
+        .intersection(forecast.index.unique(COUNTRY_LEVEL))
+        .intersection(wind_and_solar.index.unique(COUNTRY_LEVEL))
+    )
+
+    generation, forecast, wind_and_solar = (
+        df[df.index.get_level_values(COUNTRY_LEVEL).isin(countries)]
+        for df in (generation, forecast, wind_and_solar)
+    )
+
+    # total forecast w/o wind and solar, aligned on (country, date)
+    other = forecast.sub(wind_and_solar.sum(axis=1)).dropna().rename("Other")
+    df_forecast = other.to_frame().join(wind_and_solar, how="inner")
+    chart_data = pd.concat([generation, df_forecast])
+    chart_data.index.names = [COUNTRY_LEVEL, "Date"]
+    return chart_data
+
+
+def calculate_chart2_data_batch(data: OrderedDict[str, pd.DataFrame]) -> pd.DataFrame:
+    """chart2 data (installed capacity vs. current generation per fuel)
+    of all stacked countries at once, indexed by (country, fuel)
+    """
+    installed_capacity = data["df_installed_capacity"]
+    current_generation = data["df_current_generation"]
+    if installed_capacity.empty or current_generation.empty:
+        return pd.DataFrame()
+    countries = installed_capacity.index.unique(COUNTRY_LEVEL).intersection(
+        current_generation.index
+    )
+    capacity = installed_capacity.groupby(level=COUNTRY_LEVEL).last()
+    chart_data = (
+        pd.concat(
+            [capacity.stack(), current_generation.stack()],
+            axis=1,
+            keys=["capacity", "generated"],
+            join="outer",
+        )
+        .fillna(0)
+        .rename_axis([COUNTRY_LEVEL, "Fuel"])
+    )
+    return chart_data[chart_data.index.get_level_values(COUNTRY_LEVEL).isin(countries)]
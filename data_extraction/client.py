@@ -0,0 +1,190 @@
+import functools
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Tuple
+
+from requests import ConnectionError, HTTPError
+
+
+# ENTSO-E allows 400 requests per minute and user
+ENTSOE_RATE_LIMIT = float(os.getenv("ENTSOE_RATE_LIMIT", 6))
+ENTSOE_BURST = int(os.getenv("ENTSOE_BURST", 10))
+ENTSOE_MAX_RETRIES = int(os.getenv("ENTSOE_MAX_RETRIES", 4))
+# consecutive failures after which an endpoint of a country is not called for a while
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("ENTSOE_CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv("ENTSOE_CIRCUIT_RESET_SECONDS", 60))
+
+QUERY_NAMES = (
+    "query_generation",
+    "query_generation_forecast",
+    "query_installed_generation_capacity",
+    "query_wind_and_solar_forecast",
+)
+
+
+class CircuitOpenError(ConnectionError):
+    """raised instead of calling an endpoint which failed too often recently"""
+
+
+class TokenBucket:
+    """thread safe token bucket with an adaptive rate
+
+    the rate is halved whenever the server answers 429 and grows back
+    slowly (by 5% of the initial rate) with every successful request
+    """
+
+    def __init__(self, rate: float = ENTSOE_RATE_LIMIT, capacity: int = ENTSOE_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self) -> None:
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            logging.warning(f"entsoe rate limited, slowing down to {self.rate:.2f} requests/s")
+
+    def recover(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """closed: allow all calls, open: allow none until reset_seconds passed,
+        then let calls through again (half open) until the next failure
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+# shared by all clients of the process, so concurrent fetches respect one quota
+_token_bucket = TokenBucket()
+_circuit_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def _circuit_breaker(country_code: str, query_name: str) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        return _circuit_breakers.setdefault(
+            (str(country_code), query_name), CircuitBreaker()
+        )
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, HTTPError):
+        status_code = getattr(e.response, "status_code", None)
+        return status_code is None or status_code == 429 or status_code >= 500
+    return isinstance(e, ConnectionError) and not isinstance(e, CircuitOpenError)
+
+
+class ResilientEntsoeClient:
+    """wraps an EntsoePandasClient: all queries share a token bucket rate limiter,
+    retryable failures (429, 5xx, connection errors) are retried per query with
+    exponential backoff and jitter, and a circuit breaker per country and endpoint
+    stops calling an endpoint that keeps failing
+    """
+
+    def __init__(
+        self,
+        e_client,
+        token_bucket: TokenBucket | None = None,
+        max_retries: int = ENTSOE_MAX_RETRIES,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ):
+        self.e_client = e_client
+        self.token_bucket = token_bucket or _token_bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.e_client, name)
+        if name not in QUERY_NAMES:
+            return attribute
+        return self._wrap(attribute)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+        if retry_after and str(retry_after).isdigit():
+            return min(self.max_delay, float(retry_after))
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _wrap(self, query):
+        @functools.wraps(query)
+        def resilient_query(country_code, *args, **kwargs):
+            circuit_breaker = _circuit_breaker(country_code, query.__name__)
+            for attempt in range(self.max_retries + 1):
+                if not circuit_breaker.allow():
+                    raise CircuitOpenError(
+                        f"{query.__name__} for {country_code} failed too often, "
+                        f"retry in {circuit_breaker.reset_seconds} s"
+                    )
+                self.token_bucket.acquire()
+                try:
+                    result = query(country_code, *args, **kwargs)
+                except Exception as e:
+                    if not _is_retryable(e):
+                        raise
+                    circuit_breaker.record_failure()
+                    if getattr(getattr(e, "response", None), "status_code", None) == 429:
+                        self.token_bucket.throttle()
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self._backoff(attempt, e)
+                    logging.warning(
+                        f"{query.__name__} for {country_code} failed ({e}), "
+                        f"retry {attempt + 1}/{self.max_retries} in {delay:.1f} s"
+                    )
+                    time.sleep(delay)
+                else:
+                    circuit_breaker.record_success()
+                    self.token_bucket.recover()
+                    return result
+
+        return resilient_query
@@ -0,0 +1,56 @@
+import fcntl
+import hashlib
+import os
+import pathlib
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+
+# directory of the lock files, which coordinate the processes of one host
+LOCK_DIR = pathlib.Path(
+    os.getenv("ENTSOE_LOCK_DIR", pathlib.Path(tempfile.gettempdir()) / "entsoe_locks")
+)
+
+
+class SingleFlight:
+    """coalesces concurrent calls with the same key: the first caller runs the
+    function, callers arriving while it runs wait for it and share its result
+    (or its exception)
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
+
+
+@contextmanager
+def file_lock(key: Hashable):
+    """exclusive lock per key across the processes of one host"""
+    LOCK_DIR.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha1(repr(key).encode()).hexdigest() + ".lock"
+    with open(LOCK_DIR / name, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
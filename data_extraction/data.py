@@ -1,27 +1,114 @@
 from collections import OrderedDict
-from typing import OrderedDict
+from typing import OrderedDict, Dict, Iterable, List, TYPE_CHECKING
+import numpy as np
 import pandas as pd
 import os
 import sys
 import logging
+import threading
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
 from requests import HTTPError, ConnectionError
 from entsoe import EntsoePandasClient
 from entsoe.exceptions import NoMatchingDataError
+from data_extraction.cache import DatasetCache, ResponseCache
+from data_extraction.client import ResilientEntsoeClient
+from data_extraction.coalescing import SingleFlight, file_lock
+from data_extraction.fingerprint import DataSnapshot
+from data_extraction.metrics import increment, span
+from data_extraction.xml_client import StreamingEntsoeClient
 # from prefect import flow
-from dotenv import load_dotenv
 
-logging_level = logging.DEBUG
-logging.basicConfig(stream=sys.stdout, level=logging_level)
-logging.getLogger(__name__).addHandler(logging.StreamHandler(stream=sys.stdout))
-load_dotenv(override=True)
+if TYPE_CHECKING:
+    # pyarrow is only loaded when a store is used
+    from data_extraction.store import ParquetStore
 
 DEBUG = int(os.getenv("DEBUG_APP2", 0))
+# upper bound for parallel entsoe requests per DataHandler in concurrent mode
+MAX_CONCURRENT_QUERIES = int(os.getenv("ENTSOE_MAX_CONCURRENT_QUERIES", 4))
+# "pandas": EntsoePandasClient, "streaming": StreamingEntsoeClient (iterparse into numpy)
+ENTSOE_CLIENT_BACKEND = os.getenv("ENTSOE_CLIENT_BACKEND", "pandas").lower()
+# local path or s3 uri of the parquet store, which is used by default in DEBUG mode
+DATA_STORE_URI = os.getenv("DATA_STORE_URI", "./data_store")
+
+# cleaned generation values (MW with one decimal) fit into float32
+GENERATION_DTYPE = np.float32
+# size of the time range downloaded per request by DataHandler.backfill
+BACKFILL_CHUNK_SIZE = pd.Timedelta(days=int(os.getenv("ENTSOE_BACKFILL_CHUNK_DAYS", 30)))
+# upper bound for parallel entsoe requests of all DataHandlers in this process
+MAX_CONCURRENT_REQUESTS = int(os.getenv("ENTSOE_MAX_CONCURRENT_REQUESTS", 8))
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+# newest stored rows requested again by the incremental mode, the last rows of a
+# response are sometimes incomplete (see the iloc[-4] of the current generation)
+INCREMENTAL_OVERLAP_ROWS = int(os.getenv("ENTSOE_INCREMENTAL_OVERLAP_ROWS", 4))
+
+# last fetched (uncleaned) frames per country and dataset, used by the incremental
+# mode, bounded by DATASET_CACHE_MAX_MB and DATASET_CACHE_MAX_AGE_SECONDS
+_last_fetched = DatasetCache()
+# entsoe clients per api key, which share one http session with keep alive
+_entsoe_clients: Dict[str, ResilientEntsoeClient] = {}
+_entsoe_clients_lock = threading.Lock()
+# concurrent fetches of the same query, country and window share one request
+_single_flight = SingleFlight()
+
+
+def get_entsoe_client(entsoe_api_key: str) -> ResilientEntsoeClient:
+    """process wide entsoe client of an api key, its http session keeps the
+    connections to the api open for all DataHandlers and runs of the process
+    """
+    with _entsoe_clients_lock:
+        client = _entsoe_clients.get(entsoe_api_key)
+        if client is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=MAX_CONCURRENT_REQUESTS)
+            session.mount("https://", adapter)
+            client = _entsoe_clients[entsoe_api_key] = ResilientEntsoeClient(
+                StreamingEntsoeClient(entsoe_api_key, session=session)
+                if ENTSOE_CLIENT_BACKEND == "streaming"
+                else EntsoePandasClient(entsoe_api_key, session=session)
+            )
+        return client
+
+
+def evict_dataset_cache(clear: bool = False) -> int:
+    """drop the expired (or with clear all) datasets kept for incremental fetches"""
+    if clear:
+        num_entries = len(_last_fetched)
+        _last_fetched.clear()
+        return num_entries
+    return _last_fetched.evict()
 
 
 class DataHandler:
-    def __init__(self, entsoe_api_key):
+    def __init__(
+        self,
+        entsoe_api_key,
+        concurrent: bool = False,
+        e_client=None,
+        cache: ResponseCache | None = None,
+        incremental: bool = False,
+        store: "ParquetStore | None" = None,
+    ):
         # see: https://github.com/EnergieID/entsoe-py#EntsoePandasClient
-        self.e_client = EntsoePandasClient(entsoe_api_key)
+        # rate limited, retried per query with backoff, see ResilientEntsoeClient
+        if e_client is None:
+            e_client = get_entsoe_client(entsoe_api_key)
+        self.e_client = e_client
+        # if True, the entsoe queries of make_api_calls are issued in parallel
+        self.concurrent = concurrent
+        # optional persistent cache for the entsoe responses
+        self.cache = cache
+        # if True, only the delta since the last fetched timestamp is requested
+        # and merged with the frames kept from the previous call
+        self.incremental = incremental
+        # optional columnar store, the fetched datasets are written to it
+        if store is None and DEBUG:
+            from data_extraction.store import ParquetStore
+
+            store = ParquetStore(DATA_STORE_URI)
+        self.store = store
         self.data = OrderedDict()
         self._init_data()
 
@@ -36,25 +123,55 @@ class DataHandler:
     def get_new_data(self, country_code: str, forecast:bool=False) -> None:
         self._init_data()
         self.make_api_calls(country_code, forecast)
-        self.clean_api_data()
+        with span("clean", country=country_code):
+            self.clean_api_data()
 
-    def read_instant_data(self, country_code: str) -> bool:
+    def read_instant_data(
+        self,
+        country_code: str,
+        start: pd.Timestamp | None = None,
+        end: pd.Timestamp | None = None,
+        fuel_types: List[str] | None = None,
+    ) -> bool:
+        """read the datasets of a country from the store instead of the api,
+        only the [start, end) window and the given fuel types are loaded
+        """
+        if self.store is None:
+            return False
         try:
-            for name, _ in self.data.items():
-                self.data[name] = pd.read_pickle(f"./{name}_{country_code}.pkl")
-        except Exception:
+            for name in self.data:
+                self.data[name] = self.store.read(
+                    name,
+                    country_code,
+                    start=start
+                    if start is None or "installed" not in name
+                    else pd.Timestamp(year=start.year, month=1, day=1, tz=start.tz),
+                    end=end if "forecast" not in name else None,
+                    columns=fuel_types if name == "df_generation" else None,
+                )
+        except Exception as e:
+            logging.warning(f"reading from store failed: {e}")
+            return False
+        return not self.data["df_generation"].empty
+
+    def load_stored_data(
+        self,
+        country_code: str,
+        start: pd.Timestamp | None = None,
+        end: pd.Timestamp | None = None,
+        fuel_types: List[str] | None = None,
+    ) -> bool:
+        """load and clean the stored datasets, e.g. to calculate the chart data
+        of a time window for some fuel types without any api call
+        """
+        self._init_data()
+        if not self.read_instant_data(country_code, start, end, fuel_types):
             return False
+        self.clean_api_data()
         return True
 
     # @cache_data
     def make_api_calls(self, country_code: str, forecast: bool =False) -> None:
-        # just for development speed: read dataframes from disk
-        if DEBUG and not forecast and self.read_instant_data(country_code):
-            return
-        # else:
-        #     send_a_message_with_prefect(
-        #         "info from prefect: app performs entsoe api call"
-        #     )
         now = pd.Timestamp.today(tz="Europe/Brussels")
         start_t = now - pd.Timedelta(hours=24)
         if forecast:
@@ -63,105 +180,328 @@ class DataHandler:
         else:
             # start_t = now - pd.Timedelta(hours=24)
             end_t = now
-        try:
-            queries = [
-                self.e_client.query_generation,
-                self.e_client.query_generation_forecast,
-                self.e_client.query_installed_generation_capacity,
-                self.e_client.query_wind_and_solar_forecast,
-            ]
+        # just for development speed: read dataframes from disk
+        if DEBUG and not forecast and self.read_instant_data(country_code, start_t, end_t):
+            return
+        # else:
+        #     send_a_message_with_prefect(
+        #         "info from prefect: app performs entsoe api call"
+        #     )
+        queries = [
+            self.e_client.query_generation,
+            self.e_client.query_generation_forecast,
+            self.e_client.query_installed_generation_capacity,
+            self.e_client.query_wind_and_solar_forecast,
+        ]
+        if self.concurrent:
+            self._make_concurrent_api_calls(country_code, queries, start_t, end_t)
+        else:
+            try:
+                for df_name, query in zip(self.data.keys(), queries):
+                    #if forecast and not any(key in query.__name__ for key in ("forecast", "capacity")):
+                    #    continue
+                    self.data[df_name] = self._run_query(
+                        df_name, query, country_code, start_t, end_t
+                    )
+            except (NoMatchingDataError, HTTPError, ConnectionError) as e:
+                self._set_error_message(e, country_code)
+        if self.store is not None and "error" not in self.message.lower():
+            for name, df in self.data.items():
+                self.store.write(name, country_code, df)
+        for name, df in self.data.items():
+            increment("rows_fetched", len(df), country=country_code, dataset=name)
 
-            for df_name, query in zip(self.data.keys(), queries):
-                #if forecast and not any(key in query.__name__ for key in ("forecast", "capacity")):
-                #    continue
-                self.data[df_name] = query(
-                    country_code,
-                    start=start_t
-                    if "installed" not in query.__name__
-                    else pd.Timestamp(
-                        year=start_t.year, month=1, day=1, tz="Europe/Brussels"
-                    ),
-                    end=end_t
-                    if "forecast" not in query.__name__
-                    else end_t + pd.Timedelta(hours=12),
+    def _run_query(
+        self,
+        df_name: str,
+        query,
+        country_code: str,
+        start_t: pd.Timestamp,
+        end_t: pd.Timestamp,
+    ):
+        """run a single entsoe query with its query specific time window"""
+        start = (
+            start_t
+            if "installed" not in query.__name__
+            else pd.Timestamp(year=start_t.year, month=1, day=1, tz="Europe/Brussels")
+        )
+        end = (
+            end_t
+            if "forecast" not in query.__name__
+            else end_t + pd.Timedelta(hours=12)
+        )
+        with span("fetch", country=country_code, dataset=df_name):
+            if not self.incremental:
+                return self._fetch(query, country_code, start, end)
+            return self._fetch_incremental(df_name, query, country_code, start, end)
+
+    def _fetch_incremental(
+        self,
+        df_name: str,
+        query,
+        country_code: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+    ):
+        """request only what changed since the frames kept from the previous call"""
+        stored = _last_fetched.get(country_code, df_name)
+        if stored is None or stored.empty:
+            df = self._fetch(query, country_code, start, end)
+        elif "installed" in query.__name__:
+            # installed capacity is published once per year
+            df = (
+                stored
+                if stored.index[0].year == start.year
+                else self._fetch(query, country_code, start, end)
+            )
+        else:
+            df = self._fetch_delta(query, country_code, stored, start, end)
+        # shallow copy, cleaning renames self.data inplace
+        _last_fetched.put(country_code, df_name, df.copy(deep=False))
+        return df
+
+    @staticmethod
+    def _request(query, country_code: str, start: pd.Timestamp, end: pd.Timestamp):
+        increment("entsoe_requests", country=country_code, query=query.__name__)
+        with _request_slots:
+            return query(country_code, start=start, end=end)
+
+    def _fetch(self, query, country_code: str, start: pd.Timestamp, end: pd.Timestamp):
+        # same key resolution as the cache, callers some seconds apart share a request
+        key = ResponseCache.make_key(query.__name__, country_code, start, end)
+
+        def request():
+            return self._request(query, country_code, start, end)
+
+        def fetch():
+            if self.cache is None:
+                return request()
+            # processes of the same host wait for the first one and read its response
+            # from the cache instead of sending the request again
+            with file_lock(key):
+                return self.cache.get_or_fetch(
+                    query.__name__, country_code, start, end, request
                 )
-            if DEBUG:
-                for name, df in self.data.items():
-                    df.to_pickle(f"./{name}_{country_code}.pkl")
 
-        except NoMatchingDataError as e:
+        # shallow copy per caller, cleaning renames self.data inplace
+        return _single_flight.do(key, fetch).copy(deep=False)
+
+    def _fetch_delta(
+        self,
+        query,
+        country_code: str,
+        stored: pd.DataFrame | pd.Series,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+    ) -> pd.DataFrame | pd.Series:
+        """request only the interval after the newest stored rows
+        and merge it with the stored rows
+        """
+        # the newest INCREMENTAL_OVERLAP_ROWS rows are requested again and replaced,
+        # they might have been incomplete
+        delta_start = max(
+            start, stored.index[max(0, len(stored) - max(1, INCREMENTAL_OVERLAP_ROWS))]
+        )
+        if delta_start >= end:
+            df = stored
+        else:
+            try:
+                delta = self._fetch(query, country_code, delta_start, end)
+            except NoMatchingDataError:
+                # nothing new published since the last call
+                delta = stored.iloc[:0]
+            df = pd.concat([stored, delta])
+            df = df[~df.index.duplicated(keep="last")].sort_index()
+        # drop rows which fell out of the requested window
+        return df.loc[start:]
+
+    def backfill(
+        self,
+        country_code: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        chunk_size: pd.Timedelta = BACKFILL_CHUNK_SIZE,
+        max_workers: int = MAX_CONCURRENT_QUERIES,
+    ) -> Dict[str, int]:
+        """download the generation and forecast history of a country from start to end
+
+        the range is split into chunks which are downloaded concurrently and written
+        to the store as soon as they arrive, only max_workers chunks are in flight,
+        so memory stays bounded for any range. Completed chunks are marked in the
+        store and skipped, a rerun after a crash resumes with the missing chunks.
+        """
+        if self.store is None:
+            raise ValueError("backfill needs a DataHandler with a store")
+        queries = {
+            "df_generation": self.e_client.query_generation,
+            "df_generation_forecast": self.e_client.query_generation_forecast,
+            "df_wind_and_solar_forecast": self.e_client.query_wind_and_solar_forecast,
+        }
+        bounds = list(pd.date_range(start, end, freq=chunk_size)) + [end]
+        chunks = [
+            (df_name, chunk_start, chunk_end)
+            for df_name in queries
+            for chunk_start, chunk_end in zip(bounds[:-1], bounds[1:])
+            if chunk_start < chunk_end
+        ]
+
+        def marker(df_name: str, chunk_start: pd.Timestamp, chunk_end: pd.Timestamp) -> str:
+            return (
+                f"backfill/{country_code}/{df_name}/"
+                f"{chunk_start:%Y%m%dT%H%M%z}_{chunk_end:%Y%m%dT%H%M%z}"
+            )
+
+        def download(df_name: str, chunk_start: pd.Timestamp, chunk_end: pd.Timestamp) -> None:
+            try:
+                df = self._request(queries[df_name], country_code, chunk_start, chunk_end)
+            except NoMatchingDataError:
+                df = pd.DataFrame()
+            self.store.write(df_name, country_code, df)
+            self.store.write_marker(marker(df_name, chunk_start, chunk_end))
+
+        todo = [chunk for chunk in chunks if not self.store.has_marker(marker(*chunk))]
+        summary = {
+            "chunks": len(chunks),
+            "skipped": len(chunks) - len(todo),
+            "downloaded": 0,
+            "failed": 0,
+        }
+        pending = iter(todo)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            for chunk in itertools.islice(pending, max_workers):
+                in_flight[executor.submit(download, *chunk)] = chunk
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    try:
+                        future.result()
+                        summary["downloaded"] += 1
+                    except (HTTPError, ConnectionError) as e:
+                        summary["failed"] += 1
+                        logging.warning(f"backfill of {chunk} failed, rerun to resume: {e}")
+                    next_chunk = next(pending, None)
+                    if next_chunk is not None:
+                        in_flight[executor.submit(download, *next_chunk)] = next_chunk
+        logging.info(f"backfill {country_code}: {summary}")
+        return summary
+
+    def _make_concurrent_api_calls(
+        self, country_code: str, queries: list, start_t: pd.Timestamp, end_t: pd.Timestamp
+    ) -> None:
+        """issue all queries in parallel, errors are handled per query"""
+        with ThreadPoolExecutor(
+            max_workers=min(MAX_CONCURRENT_QUERIES, len(queries))
+        ) as executor:
+            futures = {
+                df_name: executor.submit(
+                    self._run_query, df_name, query, country_code, start_t, end_t
+                )
+                for df_name, query in zip(self.data.keys(), queries)
+            }
+            for df_name, future in futures.items():
+                try:
+                    self.data[df_name] = future.result()
+                except (NoMatchingDataError, HTTPError, ConnectionError) as e:
+                    self._set_error_message(e, country_code)
+
+    def _set_error_message(self, e: Exception, country_code: str) -> None:
+        if isinstance(e, NoMatchingDataError):
             self.message = f"""
                 Error: Sorry, no data available for country: {country_code} 
                 @ entsoe-API.
                 {e}
             """
-        except (HTTPError, ConnectionError) as e:
+        else:
             self.message = f"""
                 Error: Something went wrong with the http connection {e}
             """
-        for key in self.data:
-            logging.info(f"{key=}")
-            logging.info(self.data[key].head())
 
     def clean_api_data(self) -> None:
         if "error" in self.message.lower():
             return
         # clean self.df_generation (fillna(0) already done in Entsoe Client)
-        # take multiindex column names out
-        try:
-            df_cleaned_aggregation = self.data["df_generation"].swaplevel(axis=1)[
-                "Actual Aggregated"
-            ]  # df[:, 'Actual Aggregated']
-            df_cleaned_consumption = self.data["df_generation"].swaplevel(axis=1)[
-                "Actual Consumption"
-            ]  # df[:, 'Actual Aggregated']
-            common_columns = df_cleaned_aggregation.columns.intersection(
-                df_cleaned_consumption.columns
-            )
-            df_cleaned_consumption.rename(
-                columns={name: name + " (Consumption)" for name in common_columns},
-                inplace=True,
-            )
-            # iloc[-4] because last ones are sometimes incomplete
-            self.df_current_generation = df_cleaned_aggregation.iloc[-4]
-            self.data["df_generation"] = pd.concat(
-                [df_cleaned_aggregation, df_cleaned_consumption * (-1)]
-            ).dropna(axis=1, how="all")
-            del df_cleaned_aggregation
-            del df_cleaned_consumption
-        except TypeError:
+        self.data["df_generation"] = self._clean_generation(self.data["df_generation"])
+
+        # clean self.df_generation_forecast
+        self.data["df_generation_forecast"].name = "1 Day Ahead Forecast Total"
+        forecast_begin = (
+            self.data["df_generation"].index[-1]
+            if not self.data["df_generation"].empty
+            else pd.Timestamp.today(tz="Europe/Brussels")
+        )
+        for name in ("df_generation_forecast", "df_wind_and_solar_forecast"):
+            self.data[name] = self._trim_before(self.data[name], forecast_begin)
+
+    def _clean_generation(self, df_generation: pd.DataFrame) -> pd.DataFrame:
+        """take the multiindex column names out in one pass: the "Actual Aggregated"
+        columns are kept, the "Actual Consumption" columns are appended as negative
+        values, both written into one preallocated float32 array
+        """
+        if df_generation.empty:
+            self.df_current_generation = pd.Series()
+            return df_generation
+        if not isinstance(df_generation.columns, pd.MultiIndex):
             # some countries don't have multiindex column names
-            if not self.data["df_generation"].empty:
-                self.df_current_generation = self.data["df_generation"].iloc[-4]
-            else:
-                self.df_current_generation = pd.Series()
-            
-        try:
-            # clean self.df_generation_forecast
-            self.data["df_generation_forecast"].rename(
-                "1 Day Ahead Forecast Total", inplace=True
-            )
-            
-            forecast_begin = ( self.data["df_generation"].index[-1] 
-                if not self.data["df_generation"].empty
-                else pd.Timestamp.today(tz="Europe/Brussels") 
-            )
-                
-            self.data["df_generation_forecast"] = self.data["df_generation_forecast"].loc[
-                self.data["df_generation_forecast"].index
-                > forecast_begin
-            ]
-            
-            self.data["df_wind_and_solar_forecast"] = self.data[
-                "df_wind_and_solar_forecast"
-            ].loc[
-                self.data["df_wind_and_solar_forecast"].index
-                > forecast_begin
-            ]
-           
-            
-        except IndexError as e:
-            logging.warning("IndexError occured, is dataframe empty?")
+            self.df_current_generation = df_generation.iloc[self._current_row(df_generation)]
+            return df_generation.astype(GENERATION_DTYPE, copy=False)
+
+        fuels = df_generation.columns.get_level_values(0)
+        kinds = df_generation.columns.get_level_values(1)
+        aggregation_positions = np.flatnonzero(kinds == "Actual Aggregated")
+        consumption_positions = np.flatnonzero(kinds == "Actual Consumption")
+        aggregation_columns = list(fuels[aggregation_positions])
+        consumption_columns = [
+            name + " (Consumption)" if name in aggregation_columns else name
+            for name in fuels[consumption_positions]
+        ]
+
+        n_aggregation = len(aggregation_positions)
+        values = np.empty(
+            (len(df_generation), n_aggregation + len(consumption_positions)),
+            dtype=GENERATION_DTYPE,
+        )
+        for target, source in enumerate(
+            np.concatenate([aggregation_positions, consumption_positions])
+        ):
+            values[:, target] = df_generation.iloc[:, source].to_numpy()
+        np.negative(values[:, n_aggregation:], out=values[:, n_aggregation:])
+
+        # iloc[-4] because last ones are sometimes incomplete
+        self.df_current_generation = df_generation.iloc[
+            self._current_row(df_generation), aggregation_positions
+        ].droplevel(1)
+        columns = pd.Index(aggregation_columns + consumption_columns)
+        not_empty = ~np.isnan(values).all(axis=0)
+        if not not_empty.all():
+            values, columns = values[:, not_empty], columns[not_empty]
+        return pd.DataFrame(values, index=df_generation.index, columns=columns, copy=False)
+
+    @staticmethod
+    def _current_row(df: pd.DataFrame) -> int:
+        return -4 if len(df) >= 4 else -1
+
+    @staticmethod
+    def _trim_before(
+        df: pd.DataFrame | pd.Series, begin: pd.Timestamp
+    ) -> pd.DataFrame | pd.Series:
+        """keep the rows after begin, sliced on the sorted index without a mask copy"""
+        if df.empty:
+            return df
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        return df.iloc[df.index.searchsorted(begin, side="right"):]
+
+    def snapshot(self, datasets: Iterable[str] | None = None) -> DataSnapshot:
+        """content fingerprint and copy of the (cleaned) datasets, all by default,
+        compare it with the snapshot of a previous run by snapshot.change_since
+        """
+        names = self.data.keys() if datasets is None else datasets
+        return DataSnapshot.of({name: self.data[name] for name in names})
+
+    def fingerprint(self, datasets: Iterable[str] | None = None) -> str:
+        return self.snapshot(datasets).fingerprint
 
     def calculate_chart1_data(self) -> pd.DataFrame:
         if any(
@@ -211,6 +551,10 @@ class DataHandler:
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+    load_dotenv(override=True)
     FORECAST = False
 
     data_handler = DataHandler(os.getenv("ENTSOE_API_KEY", ""))
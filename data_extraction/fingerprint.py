@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import pathlib
+import pickle
+import tempfile
+import time
+from typing import Dict, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from data_extraction.cache import LocalDirectoryBackend, S3Backend
+
+
+class DataSnapshot(NamedTuple):
+    """content fingerprint and copy of cleaned datasets of a country"""
+
+    fingerprint: str
+    datasets: Dict[str, pd.DataFrame | pd.Series]
+    created: float
+
+    @classmethod
+    def of(cls, datasets: Dict[str, pd.DataFrame | pd.Series]) -> "DataSnapshot":
+        # copied, the charts rename some datasets inplace
+        datasets = {name: df.copy() for name, df in datasets.items()}
+        return cls(fingerprint_datasets(datasets), datasets, time.time())
+
+    def change_since(self, previous: "DataSnapshot | None") -> float:
+        """see relative_change, inf without a previous snapshot"""
+        if previous is None:
+            return float("inf")
+        if previous.fingerprint == self.fingerprint:
+            return 0.0
+        return relative_change(previous.datasets, self.datasets)
+
+
+def fingerprint_datasets(datasets: Dict[str, pd.DataFrame | pd.Series]) -> str:
+    """content hash of the datasets: names, columns, index and values"""
+    digest = hashlib.sha1()
+    for name in sorted(datasets):
+        df = datasets[name]
+        columns = [df.name] if isinstance(df, pd.Series) else list(df.columns)
+        digest.update(repr((name, columns, str(getattr(df.index, "tz", None)))).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _as_frame(df: pd.DataFrame | pd.Series) -> pd.DataFrame:
+    return df.to_frame() if isinstance(df, pd.Series) else df
+
+
+def relative_change(
+    previous: Dict[str, pd.DataFrame | pd.Series],
+    current: Dict[str, pd.DataFrame | pd.Series],
+) -> float:
+    """largest change of a value since previous, relative to the largest absolute
+    value of its dataset in previous
+
+    the windows of the datasets move with time: rows before the first current
+    timestamp dropped out of the window and are no change. New rows, new columns
+    or values which were published (or withdrawn) since previous are a new
+    publication and count as inf
+    """
+    change = 0.0
+    for name, df in current.items():
+        if df.empty:
+            continue
+        old = previous.get(name)
+        if old is None or old.empty:
+            return float("inf")
+        df, old = _as_frame(df), _as_frame(old)
+        if not df.columns.isin(old.columns).all():
+            return float("inf")
+        in_old_window = df.index[df.index >= old.index[0]]
+        if len(in_old_window) < len(df) or len(in_old_window.difference(old.index)):
+            return float("inf")
+        new_values = df.to_numpy(dtype=np.float64)
+        old_values = old.reindex(index=df.index, columns=df.columns).to_numpy(dtype=np.float64)
+        new_missing, old_missing = np.isnan(new_values), np.isnan(old_values)
+        if (new_missing != old_missing).any():
+            return float("inf")
+        if new_missing.all():
+            continue
+        difference = np.nanmax(np.abs(new_values - old_values))
+        scale = np.nanmax(np.abs(old_values)) or 1.0
+        change = max(change, difference / scale)
+    return change
+
+
+class FingerprintStore:
+    """snapshot of the last sent report data per country, pickled into
+    a LocalDirectoryBackend or S3Backend (see data_extraction.cache)
+    """
+
+    def __init__(self, backend: LocalDirectoryBackend | S3Backend):
+        self.backend = backend
+
+    @staticmethod
+    def _entry_name(country_code: str) -> str:
+        return f"{country_code}.pkl"
+
+    def get(self, country_code: str) -> DataSnapshot | None:
+        name = self._entry_name(country_code)
+        payload = self.backend.get(name)
+        if payload is None:
+            return None
+        try:
+            return DataSnapshot(*pickle.loads(payload))
+        except Exception:
+            logging.warning(f"corrupt fingerprint {name} is removed")
+            self.backend.delete(name)
+            return None
+
+    def put(self, country_code: str, snapshot: DataSnapshot) -> None:
+        self.backend.put(
+            self._entry_name(country_code),
+            pickle.dumps(tuple(snapshot), protocol=pickle.HIGHEST_PROTOCOL),
+        )
+
+
+def fingerprint_store_from_env() -> FingerprintStore:
+    """build the fingerprint store as configured by the env variables
+
+    FINGERPRINT_BACKEND: "local" (default) or "s3", a local directory only
+        survives the runs of one host, e.g. not those of ecs tasks
+    FINGERPRINT_DIR: directory of the local backend
+    ENTSOE_CACHE_S3_BUCKET / FINGERPRINT_S3_PREFIX / ENTSOE_CACHE_S3_ENDPOINT:
+        location of the s3 backend, by default next to the response cache
+        (needs boto3, see cache_from_env)
+    """
+    if os.getenv("FINGERPRINT_BACKEND", "local").lower() == "s3":
+        endpoint_url = os.getenv("ENTSOE_CACHE_S3_ENDPOINT")
+        backend = S3Backend(
+            os.environ["ENTSOE_CACHE_S3_BUCKET"],
+            prefix=os.getenv("FINGERPRINT_S3_PREFIX", "newsletter-fingerprints"),
+            **({"endpoint_url": endpoint_url} if endpoint_url else {}),
+        )
+    else:
+        backend = LocalDirectoryBackend(
+            os.getenv(
+                "FINGERPRINT_DIR",
+                pathlib.Path(tempfile.gettempdir()) / "newsletter_fingerprints",
+            )
+        )
+    return FingerprintStore(backend)
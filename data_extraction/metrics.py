@@ -0,0 +1,166 @@
+import json
+import os
+import pathlib
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Tuple
+
+
+# if False, span and increment return immediately and nothing is recorded
+METRICS_ENABLED = bool(int(os.getenv("METRICS_ENABLED", 0)))
+# optional file the metrics of a flow run are written to,
+# prometheus text format for *.prom, json otherwise
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_PREFIX = "newsletter"
+
+_NULL_SPAN = nullcontext()
+
+TagKey = Tuple[Tuple[str, str], ...]
+
+
+class SpanStats:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """thread safe timing spans and counters of the pipeline stages,
+    tagged e.g. with country and dataset
+
+    spans are aggregated per stage and tags (count, sum, min, max of the
+    durations), so the memory doesn't grow with the number of calls
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._spans: Dict[Tuple[str, TagKey], SpanStats] = {}
+        self._counters: Dict[Tuple[str, TagKey], float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tag_key(tags: Dict[str, object]) -> TagKey:
+        return tuple(sorted((name, str(value)) for name, value in tags.items()))
+
+    def span(self, stage: str, **tags):
+        """context manager, which records the duration of its block"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(stage, self._tag_key(tags))
+
+    @contextmanager
+    def _span(self, stage: str, tag_key: TagKey):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                stats = self._spans.get((stage, tag_key))
+                if stats is None:
+                    stats = self._spans[(stage, tag_key)] = SpanStats()
+                stats.add(duration)
+
+    def increment(self, name: str, value: float = 1, **tags) -> None:
+        if not self.enabled:
+            return
+        key = (name, self._tag_key(tags))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict[str, list]:
+        with self._lock:
+            return {
+                "spans": [
+                    {
+                        "stage": stage,
+                        "tags": dict(tag_key),
+                        "count": stats.count,
+                        "sum": stats.total,
+                        "min": stats.min,
+                        "max": stats.max,
+                    }
+                    for (stage, tag_key), stats in self._spans.items()
+                ],
+                "counters": [
+                    {"name": name, "tags": dict(tag_key), "value": value}
+                    for (name, tag_key), value in self._counters.items()
+                ],
+            }
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """spans summed over all tags, per stage"""
+        summary: Dict[str, Dict[str, float]] = {}
+        for span in self.snapshot()["spans"]:
+            stage = summary.setdefault(
+                span["stage"], {"count": 0, "sum": 0.0, "max": 0.0}
+            )
+            stage["count"] += span["count"]
+            stage["sum"] += span["sum"]
+            stage["max"] = max(stage["max"], span["max"])
+        return summary
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """prometheus / openmetrics text exposition format"""
+
+        def labels(tags: Dict[str, str]) -> str:
+            if not tags:
+                return ""
+            escaped = (
+                name
+                + '="'
+                + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+                + '"'
+                for name, value in tags.items()
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {METRICS_PREFIX}_stage_seconds summary"]
+        for span in snapshot["spans"]:
+            span_labels = labels({"stage": span["stage"], **span["tags"]})
+            lines.append(f"{METRICS_PREFIX}_stage_seconds_count{span_labels} {span['count']}")
+            lines.append(f"{METRICS_PREFIX}_stage_seconds_sum{span_labels} {span['sum']:.6f}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_stage_seconds_max gauge")
+        for span in snapshot["spans"]:
+            span_labels = labels({"stage": span["stage"], **span["tags"]})
+            lines.append(f"{METRICS_PREFIX}_stage_seconds_max{span_labels} {span['max']:.6f}")
+        for name in sorted({counter["name"] for counter in snapshot["counters"]}):
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name}_total counter")
+            for counter in snapshot["counters"]:
+                if counter["name"] == name:
+                    lines.append(
+                        f"{METRICS_PREFIX}_{name}_total{labels(counter['tags'])} "
+                        f"{counter['value']:g}"
+                    )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str | pathlib.Path) -> None:
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.to_prometheus() if path.suffix == ".prom" else self.to_json())
+
+
+# process wide metrics, shared by all DataHandlers and tasks
+metrics = Metrics()
+span = metrics.span
+increment = metrics.increment
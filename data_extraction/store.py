@@ -0,0 +1,188 @@
+import os
+import time
+import uuid
+from typing import List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+
+# separator for flattened multiindex column names, e.g. "Solar | Actual Aggregated"
+COLUMN_LEVEL_SEPARATOR = " | "
+INDEX_COLUMN = "timestamp"
+# write time of a row, newer rows win when the same timestamp is stored twice
+WRITTEN_AT_COLUMN = "_written_at"
+TIMEZONE = "Europe/Brussels"
+PARTITIONING = ds.partitioning(
+    pa.schema([("country_code", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+
+class ParquetStore:
+    """columnar store for the entsoe datasets of DataHandler
+
+    each dataset is stored as parquet files partitioned by country and date:
+        <root>/<dataset>/country_code=<country_code>/date=<yyyy-mm-dd>/<part>.parquet
+
+    every write creates new part files with unique names, so several flow runs or
+    ecs tasks can share one local volume or s3 bucket without overwriting each
+    other. Rows written twice for the same timestamp are deduplicated on read.
+    The root can be a local path or an uri like s3://bucket/prefix.
+    """
+
+    def __init__(self, root: str):
+        self.fs, self.root = pafs.FileSystem.from_uri(
+            root if "://" in root else "file://" + os.path.abspath(root)
+        )
+        self.is_local = isinstance(self.fs, pafs.LocalFileSystem)
+
+    def _dataset_path(self, dataset: str) -> str:
+        return f"{self.root}/{dataset}"
+
+    def write(self, dataset: str, country_code: str, df: pd.DataFrame | pd.Series) -> None:
+        if df.empty:
+            return
+        series_name = None
+        if isinstance(df, pd.Series):
+            series_name = str(df.name)
+            df = df.to_frame(series_name)
+        column_levels = df.columns.nlevels
+        df = df.copy(deep=False)
+        if column_levels > 1:
+            df.columns = [COLUMN_LEVEL_SEPARATOR.join(col) for col in df.columns]
+        df.columns = df.columns.astype(str)
+        df.index = df.index.tz_convert(TIMEZONE).rename(INDEX_COLUMN)
+        df[WRITTEN_AT_COLUMN] = time.time_ns()
+        df = df.reset_index()
+
+        metadata = {"column_levels": str(column_levels)}
+        if series_name is not None:
+            metadata["series_name"] = series_name
+        dates = df[INDEX_COLUMN].dt.date.astype(str)
+        part_name = f"{time.time_ns()}-{uuid.uuid4().hex}.parquet"
+        for date, df_date in df.groupby(dates):
+            table = pa.Table.from_pandas(df_date, preserve_index=False)
+            table = table.replace_schema_metadata(
+                {**(table.schema.metadata or {}), **metadata}
+            )
+            directory = (
+                f"{self._dataset_path(dataset)}/country_code={country_code}/date={date}"
+            )
+            self.fs.create_dir(directory, recursive=True)
+            path = f"{directory}/{part_name}"
+            if self.is_local:
+                # atomic on a local or mounted volume: readers never see partial files
+                tmp_path = f"{directory}/.tmp_{part_name}"
+                pq.write_table(table, tmp_path, filesystem=self.fs)
+                self.fs.move(tmp_path, path)
+            else:
+                pq.write_table(table, path, filesystem=self.fs)
+
+    def read(
+        self,
+        dataset: str,
+        country_code: str,
+        start: pd.Timestamp | None = None,
+        end: pd.Timestamp | None = None,
+        columns: List[str] | None = None,
+    ) -> pd.DataFrame | pd.Series:
+        """read one dataset of a country, only the requested columns and the
+        [start, end) window are loaded from disk
+
+        columns of multiindex datasets can be given by their first level, e.g.
+        "Solar" selects "Solar | Actual Aggregated" and "Solar | Actual Consumption"
+        """
+        path = self._dataset_path(dataset)
+        if self.fs.get_file_info(path).type == pafs.FileType.NotFound:
+            return pd.DataFrame()
+        dataset_ = ds.dataset(
+            path,
+            filesystem=self.fs,
+            format="parquet",
+            partitioning=PARTITIONING,
+            exclude_invalid_files=True,
+        )
+        # partition pruning on country and date, row group filtering on timestamp
+        partition_expression = ds.field("country_code") == country_code
+        expression = ds.scalar(True)
+        if start is not None:
+            start = start.tz_convert(TIMEZONE)
+            partition_expression &= ds.field("date") >= start.date().isoformat()
+            expression &= ds.field(INDEX_COLUMN) >= pa.scalar(start)
+        if end is not None:
+            end = end.tz_convert(TIMEZONE)
+            partition_expression &= ds.field("date") <= end.date().isoformat()
+            expression &= ds.field(INDEX_COLUMN) < pa.scalar(end)
+        expression &= partition_expression
+
+        # the schema of a dataset is the one of its first file, but the columns
+        # change over time (e.g. new fuel types): unify those of all read files
+        fragments = list(dataset_.get_fragments(filter=partition_expression))
+        if not fragments:
+            return pd.DataFrame()
+        dataset_ = ds.dataset(
+            [fragment.path for fragment in fragments],
+            schema=pa.unify_schemas(
+                [dataset_.schema] + [fragment.physical_schema for fragment in fragments],
+                promote_options="permissive",
+            ),
+            filesystem=self.fs,
+            format="parquet",
+            partitioning=PARTITIONING,
+            partition_base_dir=path,
+        )
+        metadata = dataset_.schema.metadata or {}
+        column_levels = int(metadata.get(b"column_levels", 1))
+        series_name = metadata.get(b"series_name")
+
+        data_columns = [
+            name
+            for name in dataset_.schema.names
+            if name not in (INDEX_COLUMN, WRITTEN_AT_COLUMN, "country_code", "date")
+        ]
+        if columns is not None:
+            data_columns = [
+                name
+                for name in data_columns
+                if name in columns
+                or name.split(COLUMN_LEVEL_SEPARATOR)[0] in columns
+            ]
+
+        df = (
+            dataset_.to_table(
+                columns=[INDEX_COLUMN, WRITTEN_AT_COLUMN, *data_columns],
+                filter=expression,
+            )
+            .to_pandas()
+            .sort_values([INDEX_COLUMN, WRITTEN_AT_COLUMN])
+            .drop(columns=WRITTEN_AT_COLUMN)
+            .set_index(INDEX_COLUMN)
+        )
+        if df.index.has_duplicates:
+            # merged per column: the newest value wins, columns missing in
+            # a newer part keep their older values
+            df = df.groupby(level=0, sort=False).last()
+        df = df.rename_axis(None)
+        if column_levels > 1:
+            df.columns = pd.MultiIndex.from_tuples(
+                [tuple(name.split(COLUMN_LEVEL_SEPARATOR)) for name in df.columns]
+            )
+        if series_name is not None:
+            return df.iloc[:, 0].rename(series_name.decode())
+        return df
+
+    def _marker_path(self, name: str) -> str:
+        return f"{self.root}/_markers/{name}"
+
+    def has_marker(self, name: str) -> bool:
+        """markers record finished work, e.g. completed backfill chunks"""
+        return self.fs.get_file_info(self._marker_path(name)).type == pafs.FileType.File
+
+    def write_marker(self, name: str) -> None:
+        path = self._marker_path(name)
+        self.fs.create_dir(path.rsplit("/", 1)[0], recursive=True)
+        with self.fs.open_output_stream(path) as stream:
+            stream.write(b"")
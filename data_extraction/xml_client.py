@@ -0,0 +1,251 @@
+import io
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from entsoe import EntsoeRawClient
+from entsoe.exceptions import NoMatchingDataError
+from entsoe.mappings import PSRTYPE_MAPPINGS, lookup_area
+from entsoe.misc import year_blocks
+from pandas.tseries.offsets import YearBegin, YearEnd
+
+
+# request parameters of the raw entsoe queries, see EntsoeRawClient
+QUERY_PARAMS = {
+    "query_generation": {"documentType": "A75", "processType": "A16"},
+    "query_generation_forecast": {"documentType": "A71", "processType": "A01"},
+    "query_installed_generation_capacity": {"documentType": "A68", "processType": "A33"},
+    "query_wind_and_solar_forecast": {"documentType": "A69", "processType": "A01"},
+}
+
+Segment = Tuple[pd.DatetimeIndex, np.ndarray]
+
+# the entsoe resolutions and their pandas frequencies, like the private
+# entsoe.parsers._resolution_to_timedelta of entsoe-py 0.5.10
+RESOLUTIONS = {
+    "PT15M": "15min",
+    "PT30M": "30min",
+    "PT60M": "60min",
+    "P1D": "1D",
+    "P7D": "7D",
+    "P1M": "1M",
+    "P1Y": "12M",
+}
+
+
+def _local_name(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _resolution_freq(resolution: str) -> str:
+    try:
+        return RESOLUTIONS[resolution]
+    except KeyError:
+        raise NotImplementedError(f"unknown entsoe resolution: {resolution}") from None
+
+
+def _nett(df: pd.DataFrame) -> pd.Series:
+    """production minus consumption of a fuel"""
+    if "Actual Aggregated" not in df:
+        return -df["Actual Consumption"].fillna(0)
+    if "Actual Consumption" not in df:
+        return df["Actual Aggregated"].fillna(0)
+    return df["Actual Aggregated"].fillna(0) - df["Actual Consumption"].fillna(0)
+
+
+def _nett_and_drop_redundant_columns(df: pd.DataFrame, nett: bool) -> pd.DataFrame | pd.Series:
+    """the column handling of entsoe.parsers.parse_generation (the private
+    _calc_nett_and_drop_redundant_columns of entsoe-py 0.5.10)
+    """
+    if isinstance(df.columns, pd.MultiIndex):
+        if len(df.columns.levels[-1]) == 1:
+            # the metric level is redundant with only one metric
+            return df.droplevel(axis=1, level=-1)
+        if nett:
+            frames = []
+            for fuel in df.columns.levels[-2]:
+                frames.append(_nett(df[fuel]).rename(fuel))
+            return pd.concat(frames, axis=1)
+        return df
+    if nett:
+        return _nett(df)
+    if len(df.columns) == 1:
+        return df.squeeze()
+    return df
+
+
+def iter_timeseries(source) -> Dict[str | Tuple[str, str], List[Segment]]:
+    """stream the TimeSeries of an entsoe xml document (bytes or file object)
+
+    the points of every period are written into a preallocated array, parsed
+    elements are cleared right away, so memory use is bounded by the values
+    and not by the xml tree. Returns the periods (index, values) per series
+    name, named like entsoe.parsers: (fuel, metric) or metric
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    series: Dict[str | Tuple[str, str], List[Segment]] = {}
+    root = None
+    in_period = in_point = False
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        tag = _local_name(element.tag)
+        if event == "start":
+            if root is None:
+                root = element
+            elif tag == "TimeSeries":
+                psr_type, consumption, curve_type, periods = None, False, "A01", []
+            elif tag == "Period":
+                in_period, period_start, period_end, values = True, None, None, None
+            elif tag == "Point":
+                in_point, position = True, None
+            continue
+
+        if in_point:
+            if tag == "position":
+                position = int(element.text)
+            elif tag == "quantity":
+                values[position - 1] = float(element.text)
+            elif tag == "Point":
+                in_point = False
+                element.clear()
+        elif in_period:
+            if tag == "start":
+                period_start = element.text
+            elif tag == "end":
+                period_end = element.text
+            elif tag == "resolution":
+                index = pd.date_range(
+                    pd.Timestamp(period_start),
+                    pd.Timestamp(period_end),
+                    freq=_resolution_freq(element.text),
+                    inclusive="left",
+                )
+                values = np.full(len(index), np.nan)
+            elif tag == "Period":
+                in_period = False
+                if curve_type == "A03":
+                    # variable sized blocks: a point holds until the next one
+                    values = pd.Series(values).ffill().to_numpy()
+                periods.append((index, values))
+        elif tag == "psrType":
+            psr_type = element.text
+        elif tag == "outBiddingZone_Domain.mRID":
+            # consumption of a generation unit, e.g. charging a pumped hydro plant
+            consumption = True
+        elif tag == "curveType":
+            curve_type = element.text
+        elif tag == "TimeSeries":
+            metric = "Actual Consumption" if consumption else "Actual Aggregated"
+            name = (PSRTYPE_MAPPINGS[psr_type], metric) if psr_type else metric
+            series.setdefault(name, []).extend(periods)
+            # drop the parsed TimeSeries from the tree
+            root.clear()
+    return series
+
+
+def parse_generation_stream(
+    source, nett: bool = False, sort_columns: bool = False
+) -> pd.DataFrame | pd.Series:
+    """same result as entsoe.parsers.parse_generation, without building a soup
+    and one intermediate series per TimeSeries: all periods are written into
+    one preallocated (timestamps x series) array
+
+    sort_columns orders the columns like the concat of the year_limited
+    EntsoePandasClient queries, without copying the frame afterwards
+    """
+    series = iter_timeseries(source)
+    if not series:
+        return pd.DataFrame()
+    names = list(series)
+    tuple_names = all(isinstance(name, tuple) for name in names)
+    if sort_columns and (tuple_names or not any(isinstance(name, tuple) for name in names)):
+        names.sort()
+
+    indexes = {}
+    for periods in series.values():
+        for index, _ in periods:
+            indexes.setdefault((index[0], len(index), index.freqstr), index)
+    unique_indexes = list(indexes.values())
+    global_index = unique_indexes[0]
+    for index in unique_indexes[1:]:
+        global_index = global_index.union(index)
+    rows = {
+        key: np.arange(len(index)) if index is global_index else global_index.get_indexer(index)
+        for key, index in indexes.items()
+    }
+
+    values = np.full((len(global_index), len(names)), np.nan)
+    for column, name in enumerate(names):
+        # the first period wins for duplicated timestamps, like in entsoe.parsers
+        for index, period_values in reversed(series[name]):
+            values[rows[(index[0], len(index), index.freqstr)], column] = period_values
+
+    columns = pd.MultiIndex.from_tuples(names) if tuple_names else pd.Index(names)
+    df = pd.DataFrame(values, index=global_index.rename(None), columns=columns, copy=False)
+    return _nett_and_drop_redundant_columns(df, nett=nett)
+
+
+class StreamingEntsoeClient:
+    """alternative to EntsoePandasClient for the queries used by DataHandler
+
+    requests the raw xml with EntsoeRawClient and parses it with iterparse
+    straight into numpy arrays (see parse_generation_stream), the returned
+    frames have the shapes of the EntsoePandasClient queries
+    """
+
+    def __init__(self, api_key: str, session=None, raw_client: EntsoeRawClient | None = None):
+        self.raw_client = raw_client or EntsoeRawClient(api_key, session=session)
+
+    def _query(
+        self,
+        query_name: str,
+        country_code: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+        nett: bool = False,
+    ) -> pd.DataFrame | pd.Series:
+        """year_limited like the EntsoePandasClient queries"""
+        area = lookup_area(country_code)
+        frames = []
+        for block_start, block_end in year_blocks(start, end):
+            params = {**QUERY_PARAMS[query_name], "in_Domain": area.code}
+            try:
+                # the response bytes are parsed as they are, without decoding them to str
+                response = self.raw_client._base_request(
+                    params=params, start=block_start, end=block_end
+                )
+            except NoMatchingDataError:
+                continue
+            df = parse_generation_stream(response.content, nett=nett, sort_columns=True)
+            if df.empty:
+                continue
+            df = df.tz_convert(area.tz)
+            if query_name == "query_installed_generation_capacity":
+                # the answer is always year based
+                df = df.truncate(before=block_start - YearBegin(), after=block_end + YearEnd())
+            else:
+                df = df.truncate(before=block_start, after=block_end)
+            frames.append(df)
+        if not frames:
+            raise NoMatchingDataError
+        if len(frames) == 1:
+            return frames[0]
+        df = pd.concat(frames, sort=True)
+        return df.loc[~df.index.duplicated(keep="first")]
+
+    def query_generation(self, country_code, start, end, **kwargs) -> pd.DataFrame:
+        return self._query("query_generation", country_code, start, end)
+
+    def query_generation_forecast(
+        self, country_code, start, end, **kwargs
+    ) -> pd.DataFrame | pd.Series:
+        return self._query("query_generation_forecast", country_code, start, end)
+
+    def query_installed_generation_capacity(
+        self, country_code, start, end, **kwargs
+    ) -> pd.DataFrame:
+        return self._query("query_installed_generation_capacity", country_code, start, end)
+
+    def query_wind_and_solar_forecast(self, country_code, start, end, **kwargs) -> pd.DataFrame:
+        return self._query("query_wind_and_solar_forecast", country_code, start, end, nett=True)
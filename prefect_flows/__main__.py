@@ -1,12 +1,19 @@
-
 import sys
+
+from dotenv import load_dotenv
+
+# before importing the flows, their settings are read from the env variables
+load_dotenv(override=True)
+
 from prefect_flows import send_newsletters
 
 # Access command-line arguments, if '-deploy' argument is given, 
-# prefect flow will be deployed, else locally executed
+# prefect flow will be deployed, with '-dispatch N' N sharded deployment
+# runs are started, else locally executed
 if len(sys.argv) > 1 and sys.argv[1] == '-deploy':
     deploy = True
 else:
     deploy = False
+dispatch = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[1] == '-dispatch' else 0
 
-send_newsletters.main(deploy=deploy)
\ No newline at end of file
+send_newsletters.main(deploy=deploy, dispatch=dispatch)
@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from smtplib import SMTP, SMTPException, SMTPServerDisconnected
+from typing import Callable, Iterable, List, NamedTuple
+import logging
+import os
+import queue
+import threading
+import time
+
+
+# number of authenticated smtp connections kept open
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 4))
+# maximum number of messages sent per second, 0 disables the rate limit
+EMAIL_RATE_LIMIT = float(os.getenv("EMAIL_RATE_LIMIT", 10))
+
+
+class EmailMessage(NamedTuple):
+    email_to: str
+    subject: str
+    html: str
+
+
+class DeliveryResult(NamedTuple):
+    email_to: str
+    success: bool
+    error: str = ""
+
+
+class RateLimiter:
+    """thread safe limiter, spaces out calls of acquire to the given rate per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SMTPConnectionPool:
+    """keeps up to size authenticated smtp connections open for reuse"""
+
+    def __init__(self, connect: Callable[[], SMTP], size: int = EMAIL_POOL_SIZE):
+        self.connect = connect
+        self.size = size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        # limits the number of connections, idle and in use
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                server = self._idle.get_nowait()
+            except queue.Empty:
+                server = self.connect()
+            healthy = True
+            try:
+                yield server
+            except SMTPServerDisconnected:
+                healthy = False
+                raise
+            except SMTPException:
+                # e.g. refused recipient, the connection itself is still usable
+                raise
+            except OSError:
+                healthy = False
+                raise
+            finally:
+                if healthy:
+                    self._idle.put(server)
+                else:
+                    # broken connection is dropped, the next user opens a new one
+                    self._quit(server)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _quit(server: SMTP) -> None:
+        try:
+            server.quit()
+        except (SMTPException, OSError):
+            server.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+class BatchEmailSender:
+    """sends many messages concurrently over a pool of reused smtp connections
+
+    a failed message is reported in its DeliveryResult and does not fail the batch
+    """
+
+    def __init__(
+        self,
+        email_server_credentials,
+        pool_size: int = EMAIL_POOL_SIZE,
+        rate_limit: float = EMAIL_RATE_LIMIT,
+        email_from: str | None = None,
+    ):
+        self.email_from = email_from or email_server_credentials.username
+        self.pool = SMTPConnectionPool(email_server_credentials.get_server, pool_size)
+        self.rate_limiter = RateLimiter(rate_limit)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def _build_mime_message(self, message: EmailMessage) -> MIMEMultipart:
+        mime_message = MIMEMultipart()
+        mime_message["Subject"] = message.subject
+        mime_message["From"] = self.email_from or ""
+        mime_message["To"] = message.email_to
+        mime_message.attach(MIMEText(message.html, "html"))
+        return mime_message
+
+    def send(self, message: EmailMessage) -> DeliveryResult:
+        mime_message = self._build_mime_message(message)
+        self.rate_limiter.acquire()
+        # one retry with a fresh connection, if a pooled connection was closed by the server
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as server:
+                    server.send_message(mime_message)
+                return DeliveryResult(message.email_to, True)
+            except SMTPServerDisconnected as e:
+                if attempt:
+                    return DeliveryResult(message.email_to, False, repr(e))
+            except (SMTPException, OSError) as e:
+                return DeliveryResult(message.email_to, False, repr(e))
+
+    def send_batch(self, messages: Iterable[EmailMessage]) -> List[DeliveryResult]:
+        with ThreadPoolExecutor(max_workers=self.pool.size) as executor:
+            results = list(executor.map(self.send, messages))
+        for result in results:
+            if not result.success:
+                logging.warning(f"email to {result.email_to} failed: {result.error}")
+        return results
@@ -0,0 +1,43 @@
+from collections import OrderedDict
+from typing import Tuple
+import os
+import threading
+
+import pandas as pd
+
+from data_extraction.fingerprint import fingerprint_datasets
+
+# number of rendered country reports kept in memory
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 64))
+
+_report_cache: OrderedDict[Tuple[str, str], str] = OrderedDict()
+_report_cache_lock = threading.Lock()
+
+
+def data_version(data: pd.Series | pd.DataFrame) -> str:
+    """content hash of the report data, changes whenever the data changes"""
+    return fingerprint_datasets({"report": data})
+
+
+def render_country_report(country_code: str, data: pd.Series | pd.DataFrame) -> str:
+    """render the html report body of a country once per data version,
+    the result is shared by all recipients of that country
+    """
+    key = (country_code, data_version(data))
+    with _report_cache_lock:
+        if key in _report_cache:
+            _report_cache.move_to_end(key)
+            return _report_cache[key]
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    html = f"<h1>Forecast:</h1>{frame.to_html()}"
+    with _report_cache_lock:
+        _report_cache[key] = html
+        _report_cache.move_to_end(key)
+        while len(_report_cache) > REPORT_CACHE_SIZE:
+            _report_cache.popitem(last=False)
+    return html
+
+
+def clear_report_cache() -> None:
+    with _report_cache_lock:
+        _report_cache.clear()
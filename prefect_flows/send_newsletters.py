@@ -1,17 +1,62 @@
 from prefect import flow, task, get_run_logger
 from prefect.blocks.system import Secret, String
-from prefect.task_runners import SequentialTaskRunner
-from prefect_email import EmailServerCredentials, email_send_message
+from prefect.deployments import run_deployment
+from prefect.futures import PrefectFuture
+from prefect.artifacts import create_table_artifact
+from prefect.task_runners import ConcurrentTaskRunner
 
-from typing import OrderedDict, List, Dict, NamedTuple
+from typing import OrderedDict, List, Dict, Iterator, NamedTuple, Tuple, TYPE_CHECKING
 import logging
-import pandas as pd
 from enum import Enum
 import pathlib
 import sys
+import threading
+import time
+import os
+import zlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 
-from data_extraction.data import DataHandler
-from user_management.database_handling import get_all_users_from_database
+from data_extraction.metrics import METRICS_FILE, increment, metrics, span
+from prefect_flows.email_delivery import BatchEmailSender, DeliveryResult, EmailMessage
+
+# pandas, entsoe-py, SQLAlchemy and prefect_email are imported by the tasks which
+# need them, so starting the flow (and a dispatcher run) doesn't pay for them
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from data_extraction.data import DataHandler
+    from data_extraction.fingerprint import DataSnapshot
+
+
+# if True, the newsletter is only sent to the "test-email" block instead of
+# the registered users of the database
+TEST_USER_ONLY = int(os.getenv("NEWSLETTER_TEST_USER_ONLY", 1))
+# upper bound for countries extracted at the same time in parallel mode
+MAX_CONCURRENT_COUNTRIES = int(os.getenv("MAX_CONCURRENT_COUNTRIES", 8))
+_country_slots = threading.BoundedSemaphore(MAX_CONCURRENT_COUNTRIES)
+# deployment started once per shard by the dispatcher
+SHARDED_DEPLOYMENT_NAME = os.getenv(
+    "SHARDED_DEPLOYMENT_NAME",
+    "send-newsletters-flow/deploy_newsletter_on_ecs_woTaskDef2",
+)
+# if True, the SERVE deploy mode runs the flow runs in the serving process,
+# see prefect_flows.warm_worker
+WARM_WORKER = int(os.getenv("NEWSLETTER_WARM_WORKER", 0))
+# deliveries are recorded per scheduled run and report version in the user database,
+# users who already got this version are skipped by the retries and reruns of the run
+REPORT_VERSION = os.getenv("NEWSLETTER_REPORT_VERSION", "1")
+# emails sent between two writes to the delivery ledger
+LEDGER_BATCH_SIZE = int(os.getenv("NEWSLETTER_LEDGER_BATCH_SIZE", 100))
+# a country is skipped (no charts, rendering or emails), if its report data changed
+# by at most this fraction since its last sent report, negative: always send
+CHANGE_THRESHOLD = float(os.getenv("NEWSLETTER_CHANGE_THRESHOLD", 0))
+# datasets of DataHandler.data, which the report is rendered from
+REPORT_DATASETS = ("df_generation_forecast",)
+# loaded blocks are reused for this many seconds, e.g. by the runs of a warm worker
+BLOCK_CACHE_SECONDS = float(os.getenv("BLOCK_CACHE_SECONDS", 3600))
+_blocks: Dict[Tuple[type, str], Tuple[float, object]] = {}
+_blocks_lock = threading.Lock()
 
 
 class User(NamedTuple):
@@ -20,75 +65,513 @@ class User(NamedTuple):
     country_code: str
 
 
+class CountryReport(NamedTuple):
+    body: str
+    # key of the delivery ledger, with change detection it includes the
+    # fingerprint of the data, so a rerun sends a changed report again
+    version: str
+    # stored as reference of the next run, once the report was delivered
+    snapshot: "DataSnapshot"
+    # name of the reference in the fingerprint store, see reference_name
+    reference: str
+
+
+def load_block(block_type: type, name: str):
+    """load a block once per BLOCK_CACHE_SECONDS, changes (e.g. a rotated
+    secret) are picked up by the first run after that
+    """
+    key = (block_type, name)
+    with _blocks_lock:
+        loaded = _blocks.get(key)
+        if loaded is not None and time.monotonic() - loaded[0] < BLOCK_CACHE_SECONDS:
+            return loaded[1]
+    block = block_type.load(name)
+    with _blocks_lock:
+        _blocks[key] = (time.monotonic(), block)
+    return block
+
+
 @task(retries=3, retry_delay_seconds=60)
 def get_registered_users_task() -> List[User]:
     """Read all registered users from database"""
-    # todo: users = [User(**user) for user in get_all_users_from_database()]
-     # return [User(name="test_user",email=user_email, country_code="DE")]
-    # for test purpose:
-    user_email = String.load("test-email").value
+    # for test purpose, see TEST_USER_ONLY:
+    user_email = load_block(String, "test-email").value
     return [User("test_user",user_email, "BE")]
 
 
-@flow(validate_parameters=False)
-def send_user_email_flow(user: User, data: str):
-    assert isinstance(data, str)
-    logger = get_run_logger()
-    logger.info(data)
-    email_server_credentials = EmailServerCredentials.load("my-email-credentials")
-    
+def build_user_email(user: User, report_body: str) -> EmailMessage:
+    """only the header is user specific, the report body is rendered once per country"""
     line1 = f"Hello {user.name}, <br>"
     line2 = f"Please find our lastest update for the following region: {user.country_code}<br><br>"
-    line3 = f"<h1>Forecast:</h1>"
-    subject = email_send_message.with_options(name="send-an-email").submit(
-        email_server_credentials=email_server_credentials,
-        subject="Prefect Notification",
-        msg=line1+line2+line3+data,
-        email_to=user.email,
-    )
-    return subject
+    return EmailMessage(user.email, "Prefect Notification", line1+line2+report_body)
 
 
-@task
-def extract_forecast_data_task(country_code: str, entsoe_api_key) -> OrderedDict[str,pd.DataFrame]:
-    data_handler = DataHandler(entsoe_api_key)
+_email_sender: BatchEmailSender | None = None
+# monotonic time, after which the credentials are loaded again (BLOCK_CACHE_SECONDS)
+_email_sender_expires = float("inf")
+_email_sender_lock = threading.Lock()
+
+
+def get_email_sender() -> BatchEmailSender:
+    """share the smtp connection pool, its credentials are loaded again
+    after BLOCK_CACHE_SECONDS, like the blocks of load_block
+    """
+    global _email_sender, _email_sender_expires
+    with _email_sender_lock:
+        if _email_sender is not None and time.monotonic() >= _email_sender_expires:
+            # only the idle connections, those in use are dropped with the old pool
+            _email_sender.close()
+            _email_sender = None
+        if _email_sender is None:
+            from prefect_email import EmailServerCredentials
+
+            _email_sender = BatchEmailSender(
+                load_block(EmailServerCredentials, "my-email-credentials")
+            )
+            _email_sender_expires = time.monotonic() + BLOCK_CACHE_SECONDS
+        return _email_sender
+
+
+def fetch_forecast_data(country_code: str, entsoe_api_key) -> "DataHandler":
+    from data_extraction.cache import cache_from_env
+    from data_extraction.data import DataHandler
+
+    data_handler = DataHandler(
+        entsoe_api_key, concurrent=True, cache=cache_from_env(), incremental=True
+    )
     data_handler.get_new_data(country_code, forecast=True)
-    data_handler.data["chart1_data"] = data_handler.calculate_chart1_data()
-    data_handler.data["chart2_data"] = data_handler.calculate_chart2_data()
+    return data_handler
+
+
+def calculate_chart_data(
+    country_code: str, data_handler: "DataHandler"
+) -> OrderedDict[str, "pd.DataFrame"]:
+    with span("chart", country=country_code, dataset="chart1_data"):
+        data_handler.data["chart1_data"] = data_handler.calculate_chart1_data()
+    with span("chart", country=country_code, dataset="chart2_data"):
+        data_handler.data["chart2_data"] = data_handler.calculate_chart2_data()
     return data_handler.data
 
 
-@flow(retries=3, retry_delay_seconds=60)
-def send_userspecific_newsletter_flow(user: User | Dict):
+def extract_forecast_data(country_code: str, entsoe_api_key) -> OrderedDict[str,"pd.DataFrame"]:
+    return calculate_chart_data(country_code, fetch_forecast_data(country_code, entsoe_api_key))
+
+
+def group_users_by_country(users: List[User | Dict]) -> Dict[str, List[User]]:
+    """group users by country code, so that each country's data is fetched only once"""
+    users_by_country: Dict[str, List[User]] = {}
+    for user in users:
+        if isinstance(user, Dict):
+            user = User(**user)
+        users_by_country.setdefault(user.country_code, []).append(user)
+    return users_by_country
+
+
+@task(retries=3, retry_delay_seconds=60)
+def prepare_country_report_task(
+    country_code: str,
+    entsoe_api_key,
+    report_version: str = REPORT_VERSION,
+    change_threshold: float = CHANGE_THRESHOLD,
+    reference: str | None = None,
+) -> CountryReport | None:
+    """fetch and clean the data of one country and render its report body,
+    None if the report data didn't change by more than change_threshold
+    since the last sent report of the country (stored as reference,
+    by default the country code)
+    """
+    from prefect_flows.rendering import render_country_report
+
+    reference = reference or country_code
+    with _country_slots:
+        data_handler = fetch_forecast_data(country_code, entsoe_api_key)
+        data = data_handler.data.get("df_generation_forecast")
+        if data is None or data.empty:
+            # trigger retries
+            raise ValueError(f"No data retrieved from API for country: {country_code}")
+        snapshot = data_handler.snapshot(REPORT_DATASETS)
+        if change_threshold >= 0:
+            from data_extraction.fingerprint import fingerprint_store_from_env
+
+            change = snapshot.change_since(fingerprint_store_from_env().get(reference))
+            if change <= change_threshold:
+                get_run_logger().info(
+                    f"report data of {country_code} changed by {change:.2%}, skipped"
+                )
+                increment("reports_unchanged", country=country_code)
+                return None
+            report_version = f"{report_version}-{snapshot.fingerprint[:12]}"
+        calculate_chart_data(country_code, data_handler)
+    with span("render", country=country_code):
+        body = render_country_report(country_code, data)
+    return CountryReport(body, report_version, snapshot, reference)
+
+
+def commit_sent_reports(
+    reports: Dict[str, CountryReport | None],
+    results: Dict[str, List[DeliveryResult]],
+) -> None:
+    """store the report data of the countries, whose users all got the report,
+    as the reference of the next run. Countries with failed deliveries keep the
+    old reference, so the next run sends their report again to the pending users
+    """
+    from data_extraction.fingerprint import fingerprint_store_from_env
+
+    store = fingerprint_store_from_env()
+    for country_code, report in reports.items():
+        if report is None or country_code not in results:
+            continue
+        if all(result.success for result in results[country_code]):
+            store.put(report.reference, report.snapshot)
+
+
+@task
+def send_country_newsletters_task(
+    country_code: str,
+    users: List[User],
+    report: CountryReport | None,
+    run_start: datetime.datetime | None = None,
+) -> List[DeliveryResult]:
+    """send a batch of emails, failed recipients are reported, not raised,
+    nothing is sent if the report was skipped as unchanged
+
+    with a run_start, users who are in the delivery ledger for the report version
+    are skipped and the delivered emails are recorded after every
+    LEDGER_BATCH_SIZE messages, so an interrupted task loses at most that many records
+    """
+    logger = get_run_logger()
+    if report is None:
+        return []
+    if run_start is not None:
+        from user_management.database_handling import record_deliveries
+
+        users = drop_delivered_users(users, run_start, report.version)
+    logger.info(f"sending newsletter for {country_code} to {len(users)} user(s)")
+    results: List[DeliveryResult] = []
+    with span("send", country=country_code):
+        for start in range(0, len(users), LEDGER_BATCH_SIZE):
+            chunk_results = get_email_sender().send_batch(
+                build_user_email(user, report.body)
+                for user in users[start : start + LEDGER_BATCH_SIZE]
+            )
+            if run_start is not None:
+                record_deliveries(
+                    run_start,
+                    report.version,
+                    [result.email_to for result in chunk_results if result.success],
+                )
+            results += chunk_results
+    failed = [result.email_to for result in results if not result.success]
+    increment("emails_sent", len(results) - len(failed), country=country_code)
+    increment("emails_failed", len(failed), country=country_code)
+    logger.info(f"{len(results) - len(failed)} of {len(results)} emails sent")
+    if failed:
+        logger.warning(f"sending failed for: {failed}")
+    return results
+
+
+def shard_of(key: str, shard_count: int) -> int:
+    """stable shard assignment, identical in every process (unlike hash())"""
+    return zlib.crc32(key.encode()) % shard_count
+
+
+SHARD_KEYS = ("country", "email")
+
+
+def validate_shard(shard_index: int, shard_count: int, shard_by: str) -> None:
+    """raise a ValueError for a shard, which would silently select wrong users"""
+    if shard_by not in SHARD_KEYS:
+        raise ValueError(f"shard_by must be one of {SHARD_KEYS}, got {shard_by!r}")
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"shard_index must be in [0, shard_count), got {shard_index=} {shard_count=}"
+        )
+
+
+def reference_name(
+    country_code: str, shard_index: int = 0, shard_count: int = 1, shard_by: str = "country"
+) -> str:
+    """name of the last sent report data of a country in the fingerprint store
+
+    sharded by country, a country belongs to one shard only. Sharded by email,
+    every shard sends the report to a part of the users of each country and
+    needs its own reference, otherwise the first finished shard would mark the
+    data as sent for the users of all other shards
+    """
+    if shard_count <= 1 or shard_by == "country":
+        return country_code
+    return f"{country_code}-{shard_by}-{shard_index}-of-{shard_count}"
+
+
+def in_shard(
+    user: User | Dict, shard_index: int, shard_count: int, shard_by: str = "country"
+) -> bool:
+    """shard by country (each country's data is fetched by one shard only)
+    or by the hashed email of the user (evenly sized shards)
+    """
+    if shard_count <= 1:
+        return True
     if isinstance(user, Dict):
         user = User(**user)
-    logger = get_run_logger()
+    key = user.country_code if shard_by == "country" else user.email
+    return shard_of(key, shard_count) == shard_index
+
+
+def iter_registered_user_batches(
+    shard_index: int = 0, shard_count: int = 1, shard_by: str = "country"
+) -> Iterator[List[User | Dict]]:
+    """yield the registered users of a shard in batches, streamed from the database
+
+    sharded by country, only the countries of the shard are read, country by
+    country and the one with the most users first, so its deliveries start early
+    """
+    read_by_country = not TEST_USER_ONLY and shard_by == "country"
+    if TEST_USER_ONLY:
+        batches = iter([get_registered_users_task()])
+    elif read_by_country:
+        from user_management.database_handling import (
+            count_users_by_country,
+            iter_users_by_country,
+        )
+
+        with span("read_users"):
+            counts = count_users_by_country()
+        country_codes = sorted(
+            (
+                country_code
+                for country_code in counts
+                if shard_count <= 1 or shard_of(country_code, shard_count) == shard_index
+            ),
+            key=counts.get,
+            reverse=True,
+        )
+        batches = (users for _, users in iter_users_by_country(country_codes=country_codes))
+    else:
+        from user_management.database_handling import iter_users_from_database
+
+        batches = iter_users_from_database()
+    while True:
+        with span("read_users"):
+            users = next(batches, None)
+        if users is None:
+            break
+        if not read_by_country:
+            users = [
+                user for user in users if in_shard(user, shard_index, shard_count, shard_by)
+            ]
+        if users:
+            yield users
+
+
+def current_run_start() -> datetime.datetime:
+    """scheduled start of the flow run (naive utc), the same for all its retries,
+    but different for every scheduled run of a day
+    """
+    from prefect.runtime import flow_run
+
+    return datetime.datetime.fromtimestamp(
+        flow_run.scheduled_start_time.timestamp(), tz=datetime.timezone.utc
+    ).replace(tzinfo=None)
+
+
+def drop_delivered_users(
+    users: List[User | Dict], run_start: datetime.datetime, report_version: str
+) -> List[User | Dict]:
+    """the users, who didn't get the report of this run yet"""
+    from user_management.database_handling import get_delivered_emails
+
+    emails = [user["email"] if isinstance(user, Dict) else user.email for user in users]
+    delivered = get_delivered_emails(run_start, report_version, emails)
+    if not delivered:
+        return users
+    return [user for user, email in zip(users, emails) if email not in delivered]
 
-    entsoe_api_key = Secret.load("entsoe-api-key").get()
-    data_dict = extract_forecast_data_task(user.country_code, entsoe_api_key)
-    data = data_dict.get("df_generation_forecast", pd.Series())
-    if data.empty:
-        # trigger retries
-        raise ValueError("No data retrieved from API")
-    send_user_email_flow(user, data.to_frame().to_html())
+
+def publish_metrics(shard_index: int = 0) -> None:
+    """publish the timings and counters of the run as table artifact
+    and, if METRICS_FILE is set, as prometheus text or json file
+    """
+    snapshot = metrics.snapshot()
+    rows = [
+        {
+            "stage": stats["stage"],
+            **stats["tags"],
+            "count": stats["count"],
+            "sum_s": round(stats["sum"], 4),
+            "max_s": round(stats["max"], 4),
+        }
+        for stats in snapshot["spans"]
+    ] + [
+        {"counter": counter["name"], **counter["tags"], "value": counter["value"]}
+        for counter in snapshot["counters"]
+    ]
+    create_table_artifact(
+        key=f"newsletter-metrics-shard-{shard_index}",
+        table=rows,
+        description="timings (s) per stage, country and dataset and counters of the run",
+    )
+    if METRICS_FILE:
+        metrics.write(METRICS_FILE)
 
 
 ##############
 # flow entry point:
 ##############
 
-@flow(task_runner=SequentialTaskRunner(), retries=5, retry_delay_seconds=5)
-def send_newsletters_flow():
+@flow(task_runner=ConcurrentTaskRunner(), retries=5, retry_delay_seconds=5)
+def send_newsletters_flow(
+    parallel: bool = True,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    shard_by: str = "country",
+    report_version: str = REPORT_VERSION,
+    change_threshold: float = CHANGE_THRESHOLD,
+) -> Dict[str, int]:
+    """send the newsletter to all registered users of the given shard
+
+    in parallel mode the per country extraction and the per batch delivery are
+    submitted as concurrent tasks, limited by MAX_CONCURRENT_COUNTRIES,
+    ENTSOE_MAX_CONCURRENT_REQUESTS (entsoe), DB_POOL_SIZE (database)
+    and EMAIL_POOL_SIZE (smtp)
+
+    countries, whose report data changed by at most change_threshold since
+    their last sent report, are skipped. Users, who are in the delivery ledger
+    for the scheduled start of the run and the report version, are skipped as
+    well, so a retry or rerun only sends to the pending users
+    """
+    validate_shard(shard_index, shard_count, shard_by)
     logger = get_run_logger()
     logger.setLevel(logging.INFO)
-    users = get_registered_users_task()
-    for user in users:
-        send_userspecific_newsletter_flow(user)
+    # the metrics describe one run, also if the process is reused
+    metrics.reset()
+    entsoe_api_key = load_block(Secret, "entsoe-api-key").get()
+    # the test user is not part of the user database and always gets the report
+    if TEST_USER_ONLY:
+        run_start, change_threshold = None, -1
+    else:
+        run_start = current_run_start()
+    num_users = 0
+    # only the reports are kept for the whole run (one per country),
+    # users are processed batch by batch
+    reports: Dict[str, CountryReport | None | PrefectFuture] = {}
+    deliveries: List[Tuple[str, PrefectFuture]] = []
+    results: Dict[str, List[DeliveryResult]] = {}
+    for users in iter_registered_user_batches(shard_index, shard_count, shard_by):
+        num_users += len(users)
+        for country_code, country_users in group_users_by_country(users).items():
+            if not parallel:
+                if country_code not in reports:
+                    reports[country_code] = prepare_country_report_task(
+                        country_code,
+                        entsoe_api_key,
+                        report_version,
+                        change_threshold,
+                        reference_name(country_code, shard_index, shard_count, shard_by),
+                    )
+                results.setdefault(country_code, []).extend(
+                    send_country_newsletters_task(
+                        country_code, country_users, reports[country_code], run_start
+                    )
+                )
+                continue
+            if country_code not in reports:
+                reports[country_code] = prepare_country_report_task.submit(
+                    country_code,
+                    entsoe_api_key,
+                    report_version,
+                    change_threshold,
+                    reference_name(country_code, shard_index, shard_count, shard_by),
+                )
+            deliveries.append(
+                (
+                    country_code,
+                    send_country_newsletters_task.submit(
+                        country_code, country_users, reports[country_code], run_start
+                    ),
+                )
+            )
+
+    # wait for all deliveries, so a failed country doesn't cancel the others
+    states = [(country_code, delivery.wait()) for country_code, delivery in deliveries]
+    failed = {country_code for country_code, state in states if not state.is_completed()}
+    for country_code, state in states:
+        if country_code not in failed:
+            results.setdefault(country_code, []).extend(state.result())
+    if change_threshold >= 0:
+        # the delivered reports are the references for the next run
+        commit_sent_reports(
+            {
+                country_code: report.result() if isinstance(report, PrefectFuture) else report
+                for country_code, report in reports.items()
+                if country_code not in failed
+            },
+            results,
+        )
+    if metrics.enabled:
+        # also published for failed runs, where they help most
+        logger.info(f"stages: {metrics.stage_summary()}")
+        publish_metrics(shard_index)
+    if failed:
+        raise RuntimeError(
+            f"{sum(not state.is_completed() for _, state in states)} of {len(states)} "
+            f"deliveries failed"
+        )
+    all_results = [result for country_results in results.values() for result in country_results]
+    summary = {
+        "shard_index": shard_index,
+        "sent": sum(result.success for result in all_results),
+        "failed": sum(not result.success for result in all_results),
+        # unchanged countries and users, who already got the report
+        "skipped": num_users - len(all_results),
+    }
+    logger.info(f"{summary=}")
+    return summary
 
 
-def main(deploy: bool = False) -> None:
+@flow
+def dispatch_newsletters_flow(
+    deployment_name: str = SHARDED_DEPLOYMENT_NAME,
+    shard_count: int = 4,
+    shard_by: str = "country",
+) -> List[Dict]:
+    """run one sharded deployment of send_newsletters_flow per shard
+    (e.g. one ecs task each) and collect their results
+    """
+    validate_shard(0, shard_count, shard_by)
+    logger = get_run_logger()
+
+    def run_shard(shard_index: int) -> Dict:
+        flow_run = run_deployment(
+            deployment_name,
+            parameters={
+                "shard_index": shard_index,
+                "shard_count": shard_count,
+                "shard_by": shard_by,
+            },
+            timeout=None,
+        )
+        summary = {"shard_index": shard_index, "state": flow_run.state.name}
+        try:
+            summary.update(flow_run.state.result(raise_on_failure=False))
+        except Exception:
+            # the result is only available if the shard persisted it
+            pass
+        return summary
+
+    with ThreadPoolExecutor(max_workers=shard_count) as executor:
+        summaries = list(executor.map(run_shard, range(shard_count)))
+    for summary in summaries:
+        logger.info(f"{summary=}")
+    failed = [summary for summary in summaries if summary["state"] != "Completed"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {shard_count} shards failed: {failed}")
+    return summaries
+
+
+def main(deploy: bool = False, dispatch: int = 0) -> None:
     """ execute or deploy the prefect flow (depends on deploy parameter) 
-    to send an newsletter with a report to each registered user
+    to send an newsletter with a report to each registered user,
+    if dispatch > 0, that many sharded deployment runs are started instead
     """
 
     cfd = pathlib.Path(__file__).parent
@@ -105,7 +588,16 @@ def main(deploy: bool = False) -> None:
         deploy_mode = DeployModes.ECS_PUSH_WORK_POOL
 
         ### Deployment via long running serve method locally
-        if deploy_mode == DeployModes.SERVE:
+        # the warm worker keeps sessions, pools, blocks and caches between the runs
+        if deploy_mode == DeployModes.SERVE and WARM_WORKER:
+            from prefect_flows.warm_worker import serve_warm
+
+            serve_warm(
+                send_newsletters_flow,
+                name="my-test-deployment",
+                # cron="0 * * * *",    # every hour
+            )
+        elif deploy_mode == DeployModes.SERVE:
             send_newsletters_flow.serve(
                 name="my-test-deployment", 
                 # cron="0 * * * *",    # every hour
@@ -153,17 +645,23 @@ def main(deploy: bool = False) -> None:
                 build=False,
             )
     
+    # run one deployment per shard and collect the results
+    elif dispatch:
+        dispatch_newsletters_flow(shard_count=dispatch)
+
     # run flow locally without deployment (default)
     else:
         send_newsletters_flow()
 
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
     # Access command-line arguments, if '-deploy' argument is given,
-    # prefect flow will be deployed, else locally executed
-    if len(sys.argv) > 1 and sys.argv[1] == "-deploy":
-        deploy = True
-    else:
-        deploy = False
+    # prefect flow will be deployed, with '-dispatch N' N sharded deployment
+    # runs are started, else locally executed
+    deploy = len(sys.argv) > 1 and sys.argv[1] == "-deploy"
+    dispatch = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[1] == "-dispatch" else 0
 
-    main(deploy=deploy)
\ No newline at end of file
+    main(deploy=deploy, dispatch=dispatch)
\ No newline at end of file
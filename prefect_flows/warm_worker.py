@@ -0,0 +1,190 @@
+"""warm worker: serves a flow like Flow.serve, but executes its scheduled runs
+inside the serving process instead of starting a new process per run
+
+the process wide state of the pipeline is kept between the runs: the imported
+modules, the entsoe clients with their http session (data_extraction.data),
+the database engine with its pool (user_management.database_handling), the
+smtp pool and the loaded blocks (send_newsletters) and the in memory caches of
+the datasets and reports. The caches are evicted periodically and cleared
+whenever the process grows above WARM_MAX_RSS_MB.
+
+the runner relies on internals of prefect (Runner._run_process, begin_flow_run,
+the concurrency api), it only serves with the tested PREFECT_VERSION, which is
+pinned in requirements.txt and the Dockerfile
+"""
+import asyncio
+import gc
+import importlib
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from uuid import UUID
+
+import prefect
+from prefect import Flow
+from prefect._internal.concurrency.api import create_call, from_sync
+from prefect.client.orchestration import get_client
+from prefect.client.schemas.objects import FlowRun
+from prefect.engine import begin_flow_run
+from prefect.runner import Runner
+from prefect.states import State
+from prefect.utilities.asyncutils import sync_compatible
+from prefect.utilities.callables import get_parameter_defaults
+
+
+# version of prefect, whose internals the WarmRunner was tested with
+PREFECT_VERSION = "2.14.5"
+# seconds between two evictions of the expired cache entries
+WARM_EVICTION_SECONDS = float(os.getenv("WARM_EVICTION_SECONDS", 300))
+# above this resident memory all in memory caches are cleared
+WARM_MAX_RSS_MB = float(os.getenv("WARM_MAX_RSS_MB", 1024))
+# imported once at startup instead of by the first run
+WARM_MODULES = (
+    "data_extraction.data",
+    "prefect_flows.rendering",
+    "user_management.database_handling",
+    "prefect_email",
+)
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError):
+        # peak instead of current rss: kilobytes on linux, bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def evict_caches(max_rss_mb: float = WARM_MAX_RSS_MB) -> int:
+    """drop the expired datasets, above max_rss_mb all cached datasets and
+    reports, returns the number of dropped datasets
+    """
+    from data_extraction.data import evict_dataset_cache
+    from prefect_flows.rendering import clear_report_cache
+
+    evicted = evict_dataset_cache()
+    rss = current_rss_mb()
+    if rss > max_rss_mb:
+        evicted += evict_dataset_cache(clear=True)
+        clear_report_cache()
+        gc.collect()
+        logging.warning(
+            f"rss of {rss:.0f} MiB above {max_rss_mb:.0f} MiB, caches cleared, "
+            f"now {current_rss_mb():.0f} MiB"
+        )
+    return evicted
+
+
+def _evict_periodically(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            evict_caches()
+        except Exception:
+            logging.exception("eviction of the warm caches failed")
+
+
+async def _begin_flow_run(flow: Flow, flow_run_id: UUID, user_thread: threading.Thread) -> State:
+    """like prefect.engine.retrieve_flow_then_begin_flow_run, but with the flow
+    object of this process instead of loading the entrypoint again
+    """
+    async with get_client() as client:
+        flow_run = await client.read_flow_run(flow_run_id)
+        if flow_run.empirical_policy.retry_delay is None:
+            flow_run.empirical_policy.retry_delay = flow.retry_delay_seconds
+        if flow_run.empirical_policy.retries is None:
+            flow_run.empirical_policy.retries = flow.retries
+        await client.update_flow_run(
+            flow_run_id=flow_run_id,
+            flow_version=flow.version,
+            empirical_policy=flow_run.empirical_policy,
+        )
+        parameters = (
+            flow.validate_parameters(flow_run.parameters)
+            if flow.should_validate_parameters
+            else flow_run.parameters
+        )
+        return await begin_flow_run(
+            flow=flow,
+            flow_run=flow_run,
+            parameters={**get_parameter_defaults(flow.fn), **parameters},
+            client=client,
+            user_thread=user_thread,
+        )
+
+
+def run_in_process(flow: Flow, flow_run_id: UUID) -> State:
+    """execute a scheduled flow run in the calling thread"""
+    return from_sync.wait_for_call_in_loop_thread(
+        create_call(
+            _begin_flow_run, flow, flow_run_id, user_thread=threading.current_thread()
+        )
+    )
+
+
+class WarmRunner(Runner):
+    """Runner, which executes the runs of its flows one at a time in this process
+
+    runs are not started in parallel (limit=1), the metrics and caches are process
+    wide. Cancelling a run marks it as cancelled, but can't stop it, as no process
+    is killed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **{**kwargs, "limit": 1})
+        self._flows: Dict[UUID, Flow] = {}
+        # a plain thread, in an anyio worker thread prefect would treat
+        # the sync calls of the flow (e.g. state.result()) as async ones
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-run")
+
+    @sync_compatible
+    async def add_flow(self, flow: Flow, name: str = None, **kwargs) -> UUID:
+        deployment_id = await super().add_flow(flow, name=name, **kwargs)
+        self._flows[deployment_id] = flow
+        return deployment_id
+
+    async def _run_process(self, flow_run: FlowRun, task_status=None) -> int:
+        # started without a process id, so the runner never kills this process
+        if task_status is not None:
+            task_status.started()
+        flow = self._flows[flow_run.deployment_id]
+        try:
+            await asyncio.wrap_future(self._executor.submit(run_in_process, flow, flow_run.id))
+        except Exception:
+            # the runner marks the run as crashed
+            self._logger.exception(f"flow run {flow_run.id} failed in the warm worker")
+            return 1
+        finally:
+            evict_caches()
+        return 0
+
+
+@sync_compatible
+async def serve_warm(
+    flow: Flow, name: str, eviction_seconds: float = WARM_EVICTION_SECONDS, **kwargs
+) -> None:
+    """serve the flow like flow.serve(name, **kwargs), its runs are executed by
+    a WarmRunner, the caches are evicted every eviction_seconds
+    """
+    if prefect.__version__ != PREFECT_VERSION:
+        raise RuntimeError(
+            f"the warm worker is tested with prefect {PREFECT_VERSION}, not "
+            f"{prefect.__version__}, serve without NEWSLETTER_WARM_WORKER"
+        )
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+    threading.Thread(
+        target=_evict_periodically, args=(eviction_seconds,), name="warm-eviction", daemon=True
+    ).start()
+    # like Flow.serve, the runner is created in the event loop
+    runner = WarmRunner(name=name)
+    await runner.add_flow(flow, name=name, **kwargs)
+    logging.info(f"warm worker serves {flow.name!r} as {name!r}")
+    await runner.start()
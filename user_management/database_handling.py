@@ -1,27 +1,38 @@
 import sqlalchemy as db
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import Session
-from typing import List, Dict
-from dotenv import load_dotenv
+from typing import List, Dict, Iterator, Iterable, Set, Tuple
 from contextlib import contextmanager
 import logging
 
 import pathlib
 import os
+import threading
+import csv
+import json
+import itertools
+import datetime
 
 DBBase = declarative_base()
 
-
-load_dotenv(override=True)
-
 # Set to True if local DB should be used, otherwise AWS RDS is used as specified in
 # env variable AWS_POSTGRES_ENDPOINT
 LOCAL_DB = False
 
-logging.basicConfig()
-logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
-
 DEBUG = int(os.getenv("DEBUG_APP2", 0))
+# number of users fetched per round trip when streaming the users table
+USER_CHUNK_SIZE = int(os.getenv("USER_CHUNK_SIZE", 1000))
+# number of rows written per statement by the bulk import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 5000))
+USER_FIELDS = ("name", "email", "country_code")
+# connection pool settings of the shared engine, see get_engine
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_PRE_PING = bool(int(os.getenv("DB_POOL_PRE_PING", 1)))
+# seconds after which a connection is replaced, should stay below the rds idle timeout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# number of emails per "in" clause when reading or writing the delivery ledger
+LEDGER_CHUNK_SIZE = int(os.getenv("LEDGER_CHUNK_SIZE", 500))
 logging_level = logging.DEBUG if DEBUG else logging.INFO
 logger = logging.getLogger("shared_logger")
 logger.setLevel(logging_level)
@@ -29,6 +40,13 @@ logger.setLevel(logging_level)
 
 class User(DBBase):
     __tablename__ = "registered_users"
+    # counts and reads per country are range scans of this index, in the order
+    # of iter_users_by_country, see migrate_schema for existing databases.
+    # The email is unique, import_users upserts on it
+    __table_args__ = (
+        db.Index("ix_registered_users_country_code_id", "country_code", "id"),
+        db.Index("uq_registered_users_email", "email", unique=True),
+    )
     id = db.Column("id", db.Integer, primary_key=True)
     name = db.Column("name", db.String(50), nullable=False)
     email = db.Column("email", db.String(75), nullable=False)
@@ -39,25 +57,114 @@ class User(DBBase):
         country_code={self.country_code})"
 
 
+class Delivery(DBBase):
+    """delivery ledger: one row per newsletter, which was accepted by the smtp
+    server, so that retries and reruns of a run only send the pending ones
+
+    the run is identified by its scheduled start (naive utc), which its retries
+    share, while every scheduled run (e.g. hourly) sends again
+    """
+    __tablename__ = "newsletter_deliveries"
+    # the unique constraint also serves as index of the ledger lookups
+    __table_args__ = (
+        db.UniqueConstraint("run_start", "report_version", "email", name="uq_delivery"),
+    )
+    id = db.Column("id", db.Integer, primary_key=True)
+    run_start = db.Column("run_start", db.DateTime, nullable=False)
+    report_version = db.Column("report_version", db.String(64), nullable=False)
+    email = db.Column("email", db.String(75), nullable=False)
+    delivered_at = db.Column(
+        "delivered_at", db.DateTime, nullable=False, server_default=db.func.now()
+    )
+
+
 def create_db_engine() -> db.Engine:
+    """create a new engine, use get_engine to share one engine per process"""
+    pool_options = dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
     if LOCAL_DB:
         db_file = pathlib.Path("sqlite:///users.sqlite")
-        engine = db.create_engine(f"sqlite:///{db_file.name}")
+        engine = db.create_engine(f"sqlite:///{db_file.name}", **pool_options)
     else:
         host = os.getenv("AWS_POSTGRES_ENDPOINT", "")
         logger.info(f"{host=}")
         password = os.getenv("AWS_POSTGRES_PASSWORD")
         db_name = os.getenv("AWS_POSTGRES_DB_NAME")
         engine = db.create_engine(
-            f"postgresql://postgres:{password}@{host}:5432/{db_name}"
+            f"postgresql://postgres:{password}@{host}:5432/{db_name}", **pool_options
         )
 
-    # if not db_file.is_file():
-    if not db.inspect(engine).has_table("users"):
-        DBBase.metadata.create_all(engine)
+    migrate_schema(engine)
     return engine
 
 
+# indexes of earlier schemas, which were replaced, dropped by migrate_schema
+OBSOLETE_INDEXES = {"registered_users": ("ix_registered_users_email",)}
+
+
+def _drop_duplicate_emails(engine: db.Engine) -> int:
+    """keep the newest user (highest id) per email, so that the unique email
+    index can be created, returns the number of deleted users
+    """
+    newest_ids = db.select(db.func.max(User.id)).group_by(User.email)
+    with engine.begin() as connection:
+        return connection.execute(db.delete(User).where(User.id.not_in(newest_ids))).rowcount
+
+
+def migrate_schema(engine: db.Engine) -> List[str]:
+    """bring an existing database up to date with the models: missing tables and
+    the missing indexes of existing tables are created (create_all only creates
+    the indexes of new tables), returns the names of the created objects
+
+    before the unique email index is created, users registered twice with the
+    same email are reduced to the newest one
+    """
+    inspector = db.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = [
+        table.name for table in DBBase.metadata.sorted_tables if table.name not in existing_tables
+    ]
+    DBBase.metadata.create_all(engine)
+    for table in DBBase.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                if index.name == "uq_registered_users_email":
+                    if num_deleted := _drop_duplicate_emails(engine):
+                        logger.warning(f"deleted {num_deleted} users with a duplicate email")
+                # blocks writes to the table while the index is built
+                logger.info(f"creating index {index.name} of {table.name}")
+                index.create(engine)
+                created.append(index.name)
+        for name in OBSOLETE_INDEXES.get(table.name, ()):
+            if name in existing_indexes:
+                logger.info(f"dropping index {name} of {table.name}")
+                with engine.begin() as connection:
+                    connection.exec_driver_sql(f"DROP INDEX {name}")
+    return created
+
+
+_engine: db.Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> db.Engine:
+    """process wide engine with a shared connection pool,
+    created (and the schema bootstrapped) on first use
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_db_engine()
+        return _engine
+
+
 @contextmanager
 def get_session(engine):
     session = Session(engine)
@@ -89,30 +196,319 @@ def delete_user(name: str, engine: db.engine) -> None:
         session.query(User).filter(User.name == name).delete()
 
 
-def get_all_users_from_database(engine=None) -> List[Dict]:
-    """querys for all regitered users"""
+def iter_users_from_database(
+    engine=None, chunk_size: int = USER_CHUNK_SIZE
+) -> Iterator[List[Dict]]:
+    """yields the registered users in chunks of chunk_size
+
+    only name, email and country_code are selected and the rows are streamed with a
+    server side cursor, so memory use does not grow with the size of the table
+    """
+    if not engine:
+        engine = get_engine()
+    query = db.select(User.name, User.email, User.country_code).order_by(User.id)
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(query)
+        for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+
+def count_users_by_country(
+    engine=None, country_codes: Iterable[str] | None = None
+) -> Dict[str, int]:
+    """number of registered users per country (ordered by country code),
+    of all countries or only of the given ones, e.g. of a shard or region
+    """
+    if not engine:
+        engine = get_engine()
+    query = (
+        db.select(User.country_code, db.func.count())
+        .group_by(User.country_code)
+        .order_by(User.country_code)
+    )
+    if country_codes is not None:
+        query = query.where(User.country_code.in_(list(country_codes)))
+    with engine.connect() as connection:
+        return dict(connection.execute(query).all())
+
+
+def iter_users_by_country(
+    engine=None,
+    country_codes: Iterable[str] | None = None,
+    chunk_size: int = USER_CHUNK_SIZE,
+) -> Iterator[Tuple[str, List[Dict]]]:
+    """yields (country_code, users) in chunks of chunk_size, country by country
+    in the given order (all countries ordered by code by default)
+
+    every country is read by a range of the country index, so reading a few
+    countries doesn't scan the table, a chunk holds the users of one country only
+    """
     if not engine:
-        engine = create_db_engine()
-    with Session(engine) as session:
-        users = session.query(User).all()
+        engine = get_engine()
+    if country_codes is None:
+        country_codes = count_users_by_country(engine)
+    with engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True, yield_per=chunk_size)
+        for country_code in country_codes:
+            result = connection.execute(
+                db.select(User.name, User.email, User.country_code)
+                .where(User.country_code == country_code)
+                .order_by(User.id)
+            )
+            for rows in result.partitions():
+                yield country_code, [row._asdict() for row in rows]
+
+
+def get_country_users(country_code: str, engine=None) -> List[Dict]:
+    """the registered users of one country"""
     return [
-        {"name": user.name, "email": user.email, "country_code": user.country_code}
+        user
+        for _, users in iter_users_by_country(engine, [country_code])
         for user in users
     ]
 
 
+def get_all_users_from_database(engine=None) -> List[Dict]:
+    """querys for all regitered users"""
+    return [
+        user for users in iter_users_from_database(engine) for user in users
+    ]
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    items = iter(items)
+    while chunk := list(itertools.islice(items, size)):
+        yield chunk
+
+
+def _select_delivered(
+    connection: db.Connection,
+    run_start: datetime.datetime,
+    report_version: str,
+    emails: Iterable[str],
+) -> Set[str]:
+    delivered = set()
+    for chunk in _chunks(emails, LEDGER_CHUNK_SIZE):
+        delivered.update(
+            connection.execute(
+                db.select(Delivery.email).where(
+                    Delivery.run_start == run_start,
+                    Delivery.report_version == report_version,
+                    Delivery.email.in_(chunk),
+                )
+            ).scalars()
+        )
+    return delivered
+
+
+def get_delivered_emails(
+    run_start: datetime.datetime,
+    report_version: str,
+    emails: Iterable[str],
+    engine: db.Engine | None = None,
+) -> Set[str]:
+    """the given emails, which already got the report of this run"""
+    if not engine:
+        engine = get_engine()
+    with engine.connect() as connection:
+        return _select_delivered(connection, run_start, report_version, emails)
+
+
+def _insert_delivery(connection: db.Connection):
+    """insert into the ledger, which skips rows already recorded by a concurrent
+    batch (the same email can be registered twice) instead of failing
+    """
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif connection.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(Delivery).on_conflict_do_nothing(
+        index_elements=["run_start", "report_version", "email"]
+    )
+
+
+def record_deliveries(
+    run_start: datetime.datetime,
+    report_version: str,
+    emails: Iterable[str],
+    engine: db.Engine | None = None,
+) -> int:
+    """add the delivered emails to the ledger in one transaction,
+    already recorded ones are skipped, returns the number of new rows
+    """
+    if not engine:
+        engine = get_engine()
+    emails = set(emails)
+    if not emails:
+        return 0
+    with engine.begin() as connection:
+        emails -= _select_delivered(connection, run_start, report_version, emails)
+        rows = [
+            {"run_start": run_start, "report_version": report_version, "email": email}
+            for email in emails
+        ]
+        insert = _insert_delivery(connection)
+        if rows and insert is not None:
+            connection.execute(insert, rows)
+        elif rows:
+            # other databases: row by row, a conflict only rolls back its savepoint
+            for row in rows:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(db.insert(Delivery), row)
+                except db.exc.IntegrityError:
+                    pass
+    return len(emails)
+
+
+def _read_user_file(path: str | pathlib.Path) -> Iterator[Dict]:
+    """stream users from a csv (with header) or jsonl file"""
+    path = pathlib.Path(path)
+    with open(path, newline="") as file:
+        if path.suffix in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in file if line.strip())
+        else:
+            rows = csv.DictReader(file)
+        for row in rows:
+            yield {field: row[field].strip() for field in USER_FIELDS}
+
+
+def _upsert_user(connection: db.Connection):
+    """insert into the users, which updates the user with the same email"""
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif connection.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    statement = insert(User)
+    return statement.on_conflict_do_update(
+        index_elements=["email"],
+        set_={
+            "name": statement.excluded.name,
+            "country_code": statement.excluded.country_code,
+        },
+    )
+
+
+def _upsert_user_batch(connection: db.Connection, rows: Iterable[Dict]) -> None:
+    # the last row wins, if an email is contained more than once
+    rows_by_email = {row["email"]: row for row in rows}
+    upsert = _upsert_user(connection)
+    if upsert is not None:
+        connection.execute(upsert, list(rows_by_email.values()))
+        return
+    # other databases: existing users are looked up by the email index and
+    # updated by primary key
+    existing_ids = dict(
+        connection.execute(
+            db.select(User.email, User.id).where(User.email.in_(rows_by_email))
+        ).all()
+    )
+    new_rows = [
+        row for email, row in rows_by_email.items() if email not in existing_ids
+    ]
+    changed_rows = [
+        {"b_id": existing_ids[email], "b_name": row["name"], "b_country_code": row["country_code"]}
+        for email, row in rows_by_email.items()
+        if email in existing_ids
+    ]
+    if new_rows:
+        # executed as multi row "insert ... values" statements
+        connection.execute(db.insert(User), new_rows)
+    if changed_rows:
+        connection.execute(
+            db.update(User.__table__)
+            .where(User.id == db.bindparam("b_id"))
+            .values(name=db.bindparam("b_name"), country_code=db.bindparam("b_country_code")),
+            changed_rows,
+        )
+
+
+def import_users(
+    path: str | pathlib.Path, engine: db.Engine | None = None, batch_size: int = IMPORT_BATCH_SIZE
+) -> int:
+    """bulk import users from a csv or jsonl file, existing users
+    (same email) are updated, returns the number of imported rows
+    """
+    if not engine:
+        engine = get_engine()
+    rows = _read_user_file(path)
+    num_rows = 0
+    with engine.begin() as connection:
+        while batch := list(itertools.islice(rows, batch_size)):
+            _upsert_user_batch(connection, batch)
+            num_rows += len(batch)
+    return num_rows
+
+
+def export_users(path: str | pathlib.Path, engine: db.Engine | None = None) -> int:
+    """stream all users into a csv or jsonl file, returns the number of rows"""
+    path = pathlib.Path(path)
+    num_rows = 0
+    with open(path, "w", newline="") as file:
+        if path.suffix in (".jsonl", ".ndjson"):
+            write_rows = lambda users: file.writelines(
+                json.dumps(user) + "\n" for user in users
+            )
+        else:
+            writer = csv.DictWriter(file, fieldnames=USER_FIELDS)
+            writer.writeheader()
+            write_rows = writer.writerows
+        for users in iter_users_from_database(engine):
+            write_rows(users)
+            num_rows += len(users)
+    return num_rows
+
+
+def delete_users(
+    ids: Iterable[int] = (), emails: Iterable[str] = (), engine: db.Engine | None = None
+) -> int:
+    """delete all users with one of the given ids or emails in one statement"""
+    if not engine:
+        engine = get_engine()
+    ids, emails = list(ids), list(emails)
+    if not ids and not emails:
+        return 0
+    with engine.begin() as connection:
+        result = connection.execute(
+            db.delete(User.__table__).where(
+                db.or_(User.id.in_(ids), User.email.in_(emails))
+            )
+        )
+    return result.rowcount
+
+
 if __name__ == "__main__":
     import sys
+    from dotenv import load_dotenv
+
+    # engine logging and .env only for the interactive cli, importing has no side effects
+    logging.basicConfig()
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.DEBUG)
+    load_dotenv(override=True)
 
     curr_db = "local" if LOCAL_DB else os.getenv("AWS_POSTGRES_ENDPOINT")
 
-    engine = create_db_engine()
+    engine = get_engine()
+
+    def delete_users_by_email(emails: List[str], engine: db.Engine) -> int:
+        return delete_users(emails=emails, engine=engine)
 
     menu_dict = {
         "g": get_all_users_from_database,
         "a": add_user_to_db,
         "d": delete_all_users,
         "d1": delete_user,
+        "i": import_users,
+        "x": export_users,
+        "dm": delete_users_by_email,
+        "c": count_users_by_country,
+        "m": migrate_schema,
         "e": sys.exit,
     }
 
@@ -135,6 +531,17 @@ if __name__ == "__main__":
         elif choice == "d1":
             # naive approach: no differentiation for users with the same name
             args.append(input("Please give the name of the user to be deleted: "))
+        elif choice in ("i", "x"):
+            args.append(input("Please give the path of the csv or jsonl file: ").strip())
+        elif choice == "dm":
+            args.append(
+                [
+                    email.strip()
+                    for email in input(
+                        "Please enter the emails of the users to be deleted (seperator: ','): "
+                    ).split(",")
+                ]
+            )
 
         if action:
             action() if choice == "e" else print(action(*args, engine))